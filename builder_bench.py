@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import builder_logic
+import builder_fs
+
+# Bump when the result format or the generated sites change
+BENCH_VERSION = 1
+EXTENSIONS = (".html", ".css", ".js", ".png", ".json", ".txt")
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stand-ins for the real tools: they answer version probes and create
+# what install / platform add would, without touching the network
+STUB_SCRIPTS = {
+    "node": '#!/bin/sh\necho "v20.0.0"\n',
+    "npm": ('#!/bin/sh\n'
+            'case "$1" in\n'
+            '  install|ci) mkdir -p node_modules/stub && echo "module.exports = 1;" > node_modules/stub/index.js ;;\n'
+            '  *) echo "10.0.0" ;;\n'
+            'esac\n'),
+    "cordova": ('#!/bin/sh\n'
+                'if [ "$1" = platform ]; then mkdir -p "platforms/$3"; else echo "12.0.0"; fi\n'),
+}
+STUB_SCRIPTS_WINDOWS = {
+    "node": '@echo v20.0.0\r\n',
+    "npm": ('@if "%1"=="install" goto install\r\n@if "%1"=="ci" goto install\r\n@echo 10.0.0\r\n@goto :eof\r\n'
+            ':install\r\n@mkdir node_modules\\stub 2>nul\r\n@echo module.exports = 1;> node_modules\\stub\\index.js\r\n'),
+    "cordova": ('@if "%1"=="platform" (mkdir "platforms\\%3" 2>nul) else (echo 12.0.0)\r\n'),
+}
+
+
+def install_stub_toolchain(bin_dir):
+    # Puts stub node/npm/cordova first on PATH for this process and its children
+    os.makedirs(bin_dir, exist_ok=True)
+    windows = os.name == "nt"
+    for name, script in (STUB_SCRIPTS_WINDOWS if windows else STUB_SCRIPTS).items():
+        path = os.path.join(bin_dir, name + (".cmd" if windows else ""))
+        with open(path, 'w', newline='') as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+def generate_site(root, files=1000, min_size=200, max_size=200 * 1024, depth=3, fanout=4,
+                  duplicates=0.1, seed=1):
+    """Write a synthetic website with a reproducible shape.
+
+    Sizes are log-uniform between min_size and max_size, files are spread
+    over directories up to `depth` levels deep with `fanout` children each,
+    and `duplicates` is the share of files that repeat an earlier file's
+    content. The same arguments always produce the same tree.
+    """
+    rng = random.Random(seed)
+    dirs = [""]
+    level_dirs = [""]
+    for level in range(depth):
+        level_dirs = [os.path.join(parent, f"d{level}_{i}") for parent in level_dirs for i in range(fanout)]
+        dirs += level_dirs
+    for rel in dirs:
+        os.makedirs(os.path.join(root, rel), exist_ok=True)
+
+    contents = []
+    total = 0
+    duplicated = 0
+    for index in range(files):
+        if index == 0:
+            rel = "index.html"
+        else:
+            rel = os.path.join(rng.choice(dirs), f"f{index}{rng.choice(EXTENSIONS)}")
+        if contents and rng.random() < duplicates:
+            data = rng.choice(contents)
+            duplicated += 1
+        else:
+            size = int(min_size * (max_size / min_size) ** rng.random())
+            # Text-like, compressible content, seeded so runs are comparable
+            line = hashlib.sha256(f"{seed}:{index}".encode()).hexdigest() + "\n"
+            data = (line * (size // len(line) + 1))[:size].encode()
+            if len(contents) < 256:
+                contents.append(data)
+        with open(os.path.join(root, rel), 'wb') as f:
+            f.write(data)
+        total += len(data)
+    return {"files": files, "bytes": total, "dirs": len(dirs), "duplicates": duplicated, "seed": seed}
+
+
+def touch_site(root, share, seed=2):
+    # Modifies a share of the site's files, for incremental runs
+    rng = random.Random(seed)
+    paths = sorted(builder_fs.scan_tree(root))
+    changed = rng.sample(paths, max(1, int(len(paths) * share))) if paths else []
+    for rel in changed:
+        with open(os.path.join(root, rel), 'ab') as f:
+            f.write(b"\n/* touched */\n")
+    return len(changed)
+
+
+def timed_wrap(site_dir, dest_dir, options):
+    # One wrap_project run, with its stage and copy breakdown
+    messages = []
+    builder = builder_logic.CordovaWrapperBuilder(log_callback=messages.append,
+                                                  copy_workers=options.get("copy_workers"))
+    start = time.perf_counter()
+    success = builder.wrap_project(site_dir, dest_dir, "Bench", "com.example.bench", "1.0.0",
+                                   overwrite=True, incremental=options.get("incremental", False),
+                                   link_mode=options.get("link_mode", "copy"), template_dir=TEMPLATE_DIR,
+                                   optimize=options.get("optimize", False))
+    wall = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(f"wrap_project failed: {messages[-1] if messages else 'no log'}")
+
+    # configure_project on its own, against unpatched copies of the template
+    # files (the wrapped project's are already patched)
+    snapshot = builder.resolve_template(template_dir=TEMPLATE_DIR)
+    if snapshot is None:
+        raise RuntimeError(f"resolve_template failed: {messages[-1] if messages else 'no log'}")
+    with tempfile.TemporaryDirectory(prefix="wrap-bench-configure-") as project:
+        for rel in builder.PATCHED_FILES:
+            os.makedirs(os.path.dirname(os.path.join(project, rel)), exist_ok=True)
+            shutil.copyfile(os.path.join(snapshot, rel), os.path.join(project, rel))
+        start = time.perf_counter()
+        configured = builder.configure_project(project, "Bench", "com.example.bench", "1.0.0")
+        configure = time.perf_counter() - start
+    if not configured:
+        raise RuntimeError(f"configure_project failed: {messages[-1] if messages else 'no log'}")
+
+    stages = {}
+    for span in builder.profile.spans:
+        if span.category == "stage":
+            stages[span.name] = {"wall": round(span.wall, 6), "files": span.args.get("files", 0),
+                                 "bytes": span.args.get("bytes", 0)}
+    return {"wall": round(wall, 6), "configure_project": round(configure, 6), "stages": stages}
+
+
+def summarize(runs):
+    # Median (and spread) of every timing over the repeats of a scenario
+    def med(values):
+        return round(statistics.median(values), 6)
+
+    summary = {"wall": med([run["wall"] for run in runs]),
+               "wall_min": round(min(run["wall"] for run in runs), 6),
+               "configure_project": med([run["configure_project"] for run in runs]),
+               "stages": {}}
+    for name in runs[0]["stages"]:
+        summary["stages"][name] = med([run["stages"].get(name, {}).get("wall", 0.0) for run in runs])
+    return summary
+
+
+def run_benchmark(args):
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="wrap-bench-")
+    site_dir = os.path.join(work_dir, "site")
+    dest_dir = os.path.join(work_dir, "out")
+    cache_dir = os.path.join(work_dir, "cache")
+    install_stub_toolchain(os.path.join(work_dir, "bin"))
+    os.environ["CORDOVA_WRAP_CACHE"] = cache_dir
+
+    options = {"link_mode": args.link_mode, "copy_workers": args.copy_workers, "optimize": args.minify}
+    scenarios = {"cold": [], "warm": [], "incremental_noop": [], "incremental_touched": []}
+    try:
+        shutil.rmtree(site_dir, ignore_errors=True)
+        sys.stderr.write(f"Generating {args.files} files in {site_dir}...\n")
+        site = generate_site(site_dir, files=args.files, min_size=args.min_size, max_size=args.max_size,
+                             depth=args.depth, fanout=args.fanout, duplicates=args.duplicates, seed=args.seed)
+
+        for repeat in range(args.repeat):
+            sys.stderr.write(f"Run {repeat + 1}/{args.repeat}\n")
+            # Cold: nothing cached, nothing built
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            scenarios["cold"].append(timed_wrap(site_dir, dest_dir, options))
+            # Warm: caches filled, output rebuilt from scratch
+            scenarios["warm"].append(timed_wrap(site_dir, dest_dir, options))
+            # Incremental: first run writes the manifest
+            timed_wrap(site_dir, dest_dir, dict(options, incremental=True))
+            scenarios["incremental_noop"].append(timed_wrap(site_dir, dest_dir, dict(options, incremental=True)))
+            touch_site(site_dir, args.touch, seed=args.seed + repeat + 1)
+            scenarios["incremental_touched"].append(timed_wrap(site_dir, dest_dir, dict(options, incremental=True)))
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": BENCH_VERSION,
+        "created": time.time(),
+        "commit": git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "options": {key: value for key, value in vars(args).items() if key != "func"},
+        "site": site,
+        "results": {name: {"summary": summarize(runs), "runs": runs} for name, runs in scenarios.items()},
+    }
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], cwd=TEMPLATE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def compare_results(base, new, threshold=0.1):
+    # Lines comparing median wall times; slower than threshold is a regression
+    lines = []
+    regressions = 0
+    for name, result in new["results"].items():
+        if name not in base.get("results", {}):
+            continue
+        before = base["results"][name]["summary"]
+        after = result["summary"]
+        pairs = [("total", before["wall"], after["wall"]),
+                 ("configure_project", before["configure_project"], after["configure_project"])]
+        pairs += [(stage, before["stages"].get(stage, 0.0), wall) for stage, wall in after["stages"].items()]
+        for label, old, current in pairs:
+            change = (current - old) / old if old else 0.0
+            flag = ""
+            if change > threshold and current - old > 0.005:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(f"{name:<20} {label:<18} {old:9.3f}s -> {current:9.3f}s {change:+7.1%}{flag}")
+    return lines, regressions
+
+
+def cmd_run(args):
+    result = run_benchmark(args)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for name, scenario in result["results"].items():
+        sys.stderr.write(f"{name:<20} {scenario['summary']['wall']:8.3f}s\n")
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if base.get("site") != new.get("site"):
+        sys.stderr.write("Warning: the results were measured on different sites.\n")
+    lines, regressions = compare_results(base, new, args.threshold)
+    print("\n".join(lines))
+    return 1 if regressions else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark wrap_project on synthetic sites with a stub toolchain")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Generate a site, wrap it cold, warm and incrementally, write JSON results")
+    run.add_argument("--files", type=int, default=1000, help="Number of files in the site")
+    run.add_argument("--min-size", type=int, default=200, help="Smallest file size in bytes")
+    run.add_argument("--max-size", type=int, default=200 * 1024, help="Largest file size in bytes")
+    run.add_argument("--depth", type=int, default=3, help="Directory nesting depth")
+    run.add_argument("--fanout", type=int, default=4, help="Subdirectories per directory")
+    run.add_argument("--duplicates", type=float, default=0.1, help="Share of files repeating another file")
+    run.add_argument("--touch", type=float, default=0.01, help="Share of files modified before the incremental run")
+    run.add_argument("--seed", type=int, default=1, help="Seed for the generated site")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per scenario, the median is reported")
+    run.add_argument("--link-mode", choices=builder_fs.LINK_MODES, default="copy")
+    run.add_argument("--copy-workers", type=int, help="Copy threads")
+    run.add_argument("--minify", action="store_true", help="Include the minify stage")
+    run.add_argument("--work-dir", help="Folder for the site, output and caches (kept afterwards)")
+    run.add_argument("--keep", action="store_true", help="Keep the temporary work folder")
+    run.add_argument("-o", "--output", help="Write the JSON results here instead of stdout")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="Compare two result files, exit 1 on regressions")
+    compare.add_argument("base", help="Results of the baseline commit")
+    compare.add_argument("new", help="Results to check")
+    compare.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown counted as a regression")
+    compare.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+import builder_optimize
+
+# Bump when bundling or pruning changes, so cached bundles are not reused
+BUNDLE_VERSION = 1
+BUNDLE_NAME = "js/bundle.min.js"
+# Provided by the platform at build time, never bundled
+PLATFORM_SCRIPTS = ("cordova.js", "cordova_plugins.js")
+SCRIPT_TAG_RE = re.compile(r'<script\b([^>]*)\bsrc\s*=\s*["\']([^"\']+)["\']([^>]*)>\s*</script>', re.I)
+LODASH_ASSIGN_RE = re.compile(r'^  lodash\.([A-Za-z_$][\w$]*) = [A-Za-z_$][\w$]*;\n', re.M)
+LODASH_FUNCTION_RE = re.compile(r'^  function ([A-Za-z_$][\w$]*)\(', re.M)
+LODASH_USE_RE = re.compile(r'\b(?:_|lodash)\s*\.\s*([A-Za-z_$][\w$]*)|\[\s*["\']([A-Za-z_$][\w$]*)["\']\s*\]')
+IDENT_RE = re.compile(r'[A-Za-z_$][\w$]*')
+BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def _bundlable(src, attrs, www_dir):
+    if "://" in src or src.startswith("/") or not src.endswith(".js"):
+        return False
+    if os.path.basename(src) in PLATFORM_SCRIPTS or src == BUNDLE_NAME:
+        return False
+    if re.search(r'\b(async|defer|type\s*=\s*["\']?module)', attrs, re.I):
+        return False
+    return os.path.isfile(os.path.join(www_dir, src))
+
+
+def find_script_run(html, www_dir):
+    # Longest run of adjacent local <script src> tags, as a list of matches.
+    # Only adjacent scripts are merged, so the execution order stays the same.
+    runs = []
+    current = []
+    for match in SCRIPT_TAG_RE.finditer(html):
+        if not _bundlable(match.group(2), match.group(1) + match.group(3), www_dir):
+            current = []
+            continue
+        if current and html[current[-1].end():match.start()].strip():
+            current = []
+        if not current:
+            runs.append(current)
+        current.append(match)
+    runs = [run for run in runs if len(run) > 1]
+    return max(runs, key=len) if runs else []
+
+
+def is_lodash(text):
+    return "lodash.VERSION = VERSION" in text and "function lodash(" in text
+
+
+def _code(text):
+    # text without comments, so names mentioned in docs do not count as used
+    try:
+        return "\n".join(builder_optimize.minify_js_lines(text)[0])
+    except builder_optimize.MinifyError:
+        return text
+
+
+def prune_lodash(text, other_texts):
+    """Drop lodash methods nothing refers to.
+
+    Public assignments (`lodash.name = name;`) whose name is never used as
+    `_.name`, `lodash.name` or `["name"]` are removed, then top-level
+    function declarations that are no longer referenced, until nothing
+    changes. Returns (text, removed_names). Dynamic `_[...]` access
+    disables pruning.
+    """
+    others = "\n".join(_code(other) for other in other_texts)
+    if re.search(r'\b_\s*\[\s*(?!["\'])', others):
+        return text, []
+
+    rest = _code(LODASH_ASSIGN_RE.sub("", text))
+    used = {a or b for a, b in LODASH_USE_RE.findall(others + "\n" + rest)}
+    used.add("VERSION")
+    removed = []
+
+    def drop_assignment(match):
+        if match.group(1) in used:
+            return match.group(0)
+        removed.append(match.group(1))
+        return ""
+
+    text = LODASH_ASSIGN_RE.sub(drop_assignment, text)
+
+    # Unreferenced functions, repeated since removing one can orphan others.
+    # lodash closes its top-level functions with "  }" on a line of its own.
+    while True:
+        counts = Counter(IDENT_RE.findall(_code(text)))
+        dead = []
+        for match in LODASH_FUNCTION_RE.finditer(text):
+            end = text.find("\n  }\n", match.end())
+            if end == -1:
+                continue
+            end += len("\n  }\n")
+            inside = Counter(IDENT_RE.findall(_code(text[match.start():end])))
+            name = match.group(1)
+            if counts[name] - inside[name] == 0:
+                dead.append((match.start(), end, name))
+        if not dead:
+            break
+        # Remove back to front, skipping nested overlaps
+        last_start = len(text)
+        for start, end, name in reversed(dead):
+            if end > last_start:
+                continue
+            text = text[:start] + text[end:]
+            removed.append(name)
+            last_start = start
+    return text, removed
+
+
+def _vlq(value):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ""
+    while True:
+        digit = value & 31
+        value >>= 5
+        out += BASE64[digit | (32 if value else 0)]
+        if not value:
+            return out
+
+
+def build_bundle(sources):
+    """Concatenate and minify sources, [(name, text)] in load order.
+
+    Returns (bundle_text, source_map, removed_lodash_names). The source map
+    (version 3) maps every bundle line to its line in the original file.
+    """
+    texts = dict(sources)
+    lines = []
+    mappings = []
+    removed = []
+    state = [0, 0]  # previous source index and source line
+    for index, (name, text) in enumerate(sources):
+        if is_lodash(text):
+            text, removed = prune_lodash(text, [other for other_name, other in sources if other_name != name])
+        try:
+            out_lines, line_map = builder_optimize.minify_js_lines(text)
+        except builder_optimize.MinifyError:
+            out_lines = text.split("\n")
+            line_map = list(range(len(out_lines)))
+        if index:
+            # Statement separator, in case a file does not end with ;
+            lines.append(";")
+            mappings.append("")
+        for line, source_line in zip(out_lines, line_map):
+            lines.append(line)
+            mappings.append(_vlq(0) + _vlq(index - state[0]) + _vlq(source_line - state[1]) + _vlq(0))
+            state = [index, source_line]
+
+    source_map = {
+        "version": 3,
+        "file": os.path.basename(BUNDLE_NAME),
+        "sources": [os.path.relpath(name, os.path.dirname(BUNDLE_NAME)).replace(os.sep, "/") for name in texts],
+        "names": [],
+        "mappings": ";".join(mappings),
+    }
+    lines.append(f"//# sourceMappingURL={os.path.basename(BUNDLE_NAME)}.map")
+    return "\n".join(lines) + "\n", json.dumps(source_map, separators=(",", ":")), removed
+
+
+def bundle_www(www_dir, cache_dir):
+    """Bundle the scripts index.html loads into BUNDLE_NAME and point index.html at it.
+
+    Returns None when there is nothing to bundle, else a dict with the
+    bundled "scripts", sizes "before" and "after", "removed" lodash names
+    and whether it came "from_cache".
+    """
+    html_path = os.path.join(www_dir, "index.html")
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    run = find_script_run(html, www_dir)
+    if not run:
+        return None
+
+    sources = []
+    for match in run:
+        with open(os.path.join(www_dir, match.group(2)), 'r', encoding='utf-8') as f:
+            sources.append((match.group(2), f.read()))
+    if any(text.lstrip().startswith(("'use strict'", '"use strict"')) for _, text in sources[1:]):
+        # Would turn into a plain expression and drop strict mode
+        return None
+
+    key = hashlib.sha256(f"bundle{BUNDLE_VERSION}:{builder_optimize.MINIFY_VERSION}\0".encode() + b"".join(
+        name.encode() + b"\0" + text.encode() + b"\0" for name, text in sources)).hexdigest()
+    cache_base = os.path.join(cache_dir, "bundles", key[:2], key)
+    from_cache = all(os.path.exists(cache_base + ext) for ext in (".js", ".js.map", ".json"))
+    if from_cache:
+        with open(cache_base + ".js", 'rb') as f:
+            bundle = f.read()
+        with open(cache_base + ".js.map", 'rb') as f:
+            source_map = f.read()
+        with open(cache_base + ".json", 'r') as f:
+            removed = json.load(f)["removed"]
+    else:
+        bundle, source_map, removed = build_bundle(sources)
+        bundle, source_map = bundle.encode('utf-8'), source_map.encode('utf-8')
+        builder_optimize.write_atomic(cache_base + ".js", bundle)
+        builder_optimize.write_atomic(cache_base + ".js.map", source_map)
+        builder_optimize.write_atomic(cache_base + ".json", json.dumps({"removed": removed}).encode())
+
+    bundle_path = os.path.join(www_dir, BUNDLE_NAME)
+    builder_optimize.write_atomic(bundle_path, bundle)
+    builder_optimize.write_atomic(bundle_path + ".map", source_map)
+
+    # One tag for the bundle where the first script was, the others removed
+    tag = f'<script type="text/javascript" src="{BUNDLE_NAME}"></script>'
+    new_html = html[:run[0].start()] + tag + html[run[-1].end():]
+    builder_optimize.write_atomic(html_path, new_html.encode('utf-8'))
+
+    return {
+        "scripts": [name for name, _ in sources],
+        "before": sum(len(text.encode('utf-8')) for _, text in sources),
+        "after": len(bundle),
+        "removed": removed,
+        "from_cache": from_cache,
+    }
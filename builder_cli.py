@@ -0,0 +1,352 @@
+import os
+import sys
+import csv
+import contextlib
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import builder_logic
+import builder_export
+import builder_fs
+import builder_templates
+
+# Columns every job in a batch manifest must have
+JOB_FIELDS = ("target_dir", "dest_dir", "app_name", "app_id", "app_version")
+TRUE_VALUES = ("1", "true", "yes", "y", "on")
+
+# Exit codes
+EXIT_OK = 0
+EXIT_JOB_FAILED = 1
+EXIT_USAGE = 2
+
+
+def parse_job(row, base_dir, index=0):
+    # One job from a manifest row (a dict of strings, or JSON values).
+    # Relative paths are taken relative to base_dir.
+    missing = [field for field in JOB_FIELDS if not str(row.get(field) or "").strip()]
+    if missing:
+        raise ValueError(f"Job {index + 1} is missing: {', '.join(missing)}")
+    job = {field: str(row[field]).strip() for field in JOB_FIELDS}
+    for field in ("target_dir", "dest_dir"):
+        job[field] = os.path.join(base_dir, os.path.expanduser(job[field]))
+    if row.get("export"):
+        job["export"] = os.path.join(base_dir, os.path.expanduser(str(row["export"]).strip()))
+    for flag in ("overwrite", "incremental", "optimize", "optimize_images", "bundle_js", "preflight", "strict_preflight",
+                 "dedupe"):
+        if flag in row and row[flag] not in (None, ""):
+            value = row[flag]
+            job[flag] = value if isinstance(value, bool) else str(value).strip().lower() in TRUE_VALUES
+    if row.get("link_mode"):
+        job["link_mode"] = str(row["link_mode"]).strip()
+    if row.get("template"):
+        job["template"] = str(row["template"]).strip()
+    if row.get("platforms"):
+        job["platforms"] = builder_logic.parse_platforms(row["platforms"])
+    job["name"] = str(row.get("name") or job["app_id"])
+    return job
+
+
+def load_jobs(manifest_path):
+    # Jobs come from a JSON list (or {"jobs": [...]}) or a CSV file with a
+    # header row. Relative paths are taken relative to the manifest.
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith(".csv"):
+        with open(manifest_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(manifest_path, 'r') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get("jobs", [])
+    return [parse_job(row, base_dir, index) for index, row in enumerate(rows)]
+
+
+def run_job(job, options):
+    # Runs in a worker process, so everything it needs comes in as arguments
+    log_path = os.path.join(options["log_dir"], f"{job['name']}.log") if options.get("log_dir") else None
+    # Error-level messages, the last one is the job's error when it fails
+    errors = []
+
+    with open(log_path, 'w') if log_path else contextlib.nullcontext() as log_file:
+        def log(message, level="info"):
+            if level == "error":
+                errors.append(message)
+            if log_file:
+                log_file.write(message + "\n")
+                log_file.flush()
+            if options.get("verbose"):
+                sys.stderr.write(f"[{job['name']}] {message}\n")
+
+        builder = builder_logic.CordovaWrapperBuilder(log_callback=log, log_levels=True,
+                                                      copy_workers=options.get("copy_workers"),
+                                                      image_max_size=options.get("image_max_size"),
+                                                      image_webp=options.get("webp", False))
+        result = {
+            "name": job["name"],
+            "target_dir": job["target_dir"],
+            "dest_dir": job["dest_dir"],
+            "started": time.time(),
+        }
+        start = time.perf_counter()
+        try:
+            success = builder.wrap_project(
+                job["target_dir"], job["dest_dir"], job["app_name"], job["app_id"], job["app_version"],
+                overwrite=job.get("overwrite", options.get("overwrite", False)),
+                incremental=job.get("incremental", options.get("incremental", False)),
+                link_mode=job.get("link_mode", options.get("link_mode", "copy")),
+                optimize=job.get("optimize", options.get("optimize", False)),
+                optimize_images=job.get("optimize_images", options.get("optimize_images", False)),
+                bundle_js=job.get("bundle_js", options.get("bundle_js", False)),
+                template_dir=options.get("template_dir"),
+                template=job.get("template", options.get("template")),
+                platforms=job.get("platforms", options.get("platforms")),
+                preflight=job.get("preflight", options.get("preflight", True)),
+                strict_preflight=job.get("strict_preflight", options.get("strict_preflight", False)),
+                dedupe=job.get("dedupe", options.get("dedupe", False)),
+                export_path=job.get("export"),
+                export_excludes=options.get("export_excludes"),
+                check_deps=False
+            )
+            result["platforms"] = builder.platform_results
+            if builder.preflight_report:
+                result["preflight"] = {
+                    "files": len(builder.preflight_report["index"]),
+                    "total_size": builder.preflight_report["total_size"],
+                    "errors": builder.preflight_report["errors"],
+                    "warnings": [message for kind, message in builder.preflight_report["warnings"]],
+                }
+            if builder.dedupe_report:
+                report = builder.dedupe_report
+                result["dedupe"] = {"files": report["files"], "wasted": report["wasted"], "linked": report["linked"]}
+                if options.get("dedupe_report"):
+                    result["dedupe"]["groups"] = report["groups"]
+            result["status"] = "ok" if success else "failed"
+            result["exit_code"] = EXIT_OK if success else EXIT_JOB_FAILED
+            if not success and errors:
+                result["error"] = errors[-1]
+        except Exception as e:
+            log(f"Exception: {e}", "error")
+            result["status"] = "error"
+            result["exit_code"] = EXIT_JOB_FAILED
+            result["error"] = str(e)
+    result["duration"] = round(time.perf_counter() - start, 3)
+    result["finished"] = time.time()
+    return result
+
+
+def run_batch(jobs, options, concurrency=1):
+    summary = {"started": time.time(), "jobs": []}
+    start = time.perf_counter()
+
+    # One toolchain check for the whole batch instead of one per job
+    builder = builder_logic.CordovaWrapperBuilder(log_callback=lambda m: sys.stderr.write(m + "\n"))
+    summary["dependencies_ok"] = builder.check_dependencies()
+    if not summary["dependencies_ok"]:
+        summary["duration"] = round(time.perf_counter() - start, 3)
+        summary["exit_code"] = EXIT_JOB_FAILED
+        return summary
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_job, job, options): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker process died
+                result = {"name": jobs[index]["name"], "status": "error", "exit_code": EXIT_JOB_FAILED,
+                          "error": str(e)}
+            results[index] = result
+            sys.stderr.write(f"{result['name']}: {result['status']} ({result.get('duration', 0)}s)\n")
+
+    summary["jobs"] = [results[index] for index in range(len(jobs))]
+    summary["succeeded"] = sum(1 for r in summary["jobs"] if r["status"] == "ok")
+    summary["failed"] = len(jobs) - summary["succeeded"]
+    summary["duration"] = round(time.perf_counter() - start, 3)
+    summary["exit_code"] = EXIT_OK if summary["failed"] == 0 else EXIT_JOB_FAILED
+    return summary
+
+
+def cmd_batch(args):
+    try:
+        jobs = load_jobs(args.manifest)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Could not read manifest: {e}\n")
+        return EXIT_USAGE
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    options = {
+        "overwrite": args.overwrite,
+        "incremental": args.incremental,
+        "link_mode": args.link_mode,
+        "optimize": args.minify,
+        "optimize_images": args.optimize_images or args.webp or bool(args.image_max_size),
+        "image_max_size": args.image_max_size,
+        "webp": args.webp,
+        "bundle_js": args.bundle_js,
+        "platforms": builder_logic.parse_platforms(args.platforms),
+        "preflight": not args.no_preflight,
+        "strict_preflight": args.strict_preflight,
+        "dedupe": args.dedupe or args.dedupe_report,
+        "dedupe_report": args.dedupe_report,
+        "export_excludes": builder_export.DEFAULT_EXCLUDES + tuple(args.exclude) if args.exclude else None,
+        "template_dir": os.path.abspath(args.template) if os.path.isdir(args.template) else None,
+        "template": None if os.path.isdir(args.template) else args.template,
+        "copy_workers": args.copy_workers,
+        "log_dir": os.path.abspath(args.log_dir) if args.log_dir else None,
+        "verbose": args.verbose,
+    }
+    summary = run_batch(jobs, options, concurrency=args.jobs)
+
+    output = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return summary["exit_code"]
+
+
+def cmd_template(args):
+    registry = builder_templates.TemplateRegistry()
+    try:
+        if args.action == "add":
+            snapshot = registry.add(args.name, args.source)
+            print(f"{args.name}: {os.path.basename(snapshot)} ({registry.info(args.name)['files']} files)")
+        elif args.action == "list":
+            for name in registry.names():
+                info = registry.info(name)
+                print(f"{name:<24} {info['hash'][:12]}  {info['files']:>6} files  {info['source']}")
+        elif args.action == "remove":
+            if not registry.remove(args.name):
+                sys.stderr.write(f"Template '{args.name}' is not registered.\n")
+                return EXIT_USAGE
+    except (builder_templates.TemplateError, OSError) as e:
+        sys.stderr.write(f"{e}\n")
+        return EXIT_USAGE
+    return EXIT_OK
+
+
+def cmd_export(args):
+    excludes = () if args.no_default_excludes else builder_export.DEFAULT_EXCLUDES
+    excludes += tuple(args.exclude)
+    if not os.path.isdir(args.project):
+        sys.stderr.write(f"{args.project} is not a folder.\n")
+        return EXIT_USAGE
+    try:
+        result = builder_export.export_project(args.project, args.archive, fmt=args.format, excludes=excludes,
+                                               workers=args.workers, level=args.level)
+    except builder_export.ExportError as e:
+        sys.stderr.write(f"{e}\n")
+        return EXIT_USAGE
+    except OSError as e:
+        sys.stderr.write(f"Could not export project: {e}\n")
+        return EXIT_JOB_FAILED
+    print(f"{args.archive}: {result['files']} files, {result['size']} bytes -> {result['archive_size']} bytes")
+    return EXIT_OK
+
+
+def cmd_watch(args):
+    builder = builder_logic.CordovaWrapperBuilder(log_callback=lambda m: sys.stderr.write(m + "\n"))
+    result = []
+    done = threading.Event()
+
+    def watch():
+        try:
+            result.append(builder.watch_project(os.path.abspath(args.target_dir), os.path.abspath(args.dest_dir),
+                                                link_mode=args.link_mode, prepare=args.prepare, poll=args.poll))
+        finally:
+            done.set()
+
+    # In a thread, so Ctrl+C can stop a running `cordova prepare` as well
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        while not done.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        builder.cancel()
+        done.wait()
+    return EXIT_OK if result and result[0] else EXIT_JOB_FAILED
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless Cordova App Wrapper")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="Wrap all sites listed in a JSON or CSV manifest")
+    batch.add_argument("manifest", help="JSON or CSV file with target_dir, dest_dir, app_name, app_id, app_version")
+    batch.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                       help="Number of sites wrapped concurrently")
+    batch.add_argument("--summary", help="Write the JSON summary here instead of stdout")
+    batch.add_argument("--log-dir", help="Write one log file per job into this folder")
+    batch.add_argument("--template", default=os.path.dirname(os.path.abspath(__file__)),
+                       help="Registered template name or template project folder (default: the folder of this script)")
+    batch.add_argument("--overwrite", action="store_true", help="Replace existing output folders")
+    batch.add_argument("--incremental", action="store_true", help="Only sync changed files into existing projects")
+    batch.add_argument("--link-mode", choices=builder_fs.LINK_MODES, default="copy",
+                       help="How site files are placed in www/site")
+    batch.add_argument("--minify", action="store_true", help="Minify the HTML, CSS and JS of the sites")
+    batch.add_argument("--bundle-js", action="store_true", help="Bundle the app's own scripts into one minified file")
+    batch.add_argument("--optimize-images", action="store_true", help="Recompress PNG images losslessly")
+    batch.add_argument("--image-max-size", type=int, metavar="PIXELS",
+                       help="Scale images down to at most this many pixels on the longest side (needs Pillow)")
+    batch.add_argument("--webp", action="store_true", help="Convert images to WebP where smaller (needs Pillow)")
+    batch.add_argument("--platforms", default="android",
+                       help="Comma-separated Cordova platforms to add, concurrently (e.g. android,browser)")
+    batch.add_argument("--no-preflight", action="store_true", help="Skip the check of the sites before wrapping")
+    batch.add_argument("--strict-preflight", action="store_true",
+                       help="Fail jobs whose site has warnings (broken references, large files)")
+    batch.add_argument("--dedupe", action="store_true", help="Hardlink site files with identical content")
+    batch.add_argument("--dedupe-report", action="store_true",
+                       help="Like --dedupe, and list the duplicate files in the summary")
+    batch.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                       help="Also leave files matching PATTERN out of the export archives (repeatable)")
+    batch.add_argument("--copy-workers", type=int, help="Copy threads per job")
+    batch.add_argument("-v", "--verbose", action="store_true", help="Print job logs to stderr")
+    batch.set_defaults(func=cmd_batch)
+
+    template = sub.add_parser("template", help="Manage named template snapshots")
+    template_sub = template.add_subparsers(dest="action", required=True)
+    add = template_sub.add_parser("add", help="Snapshot a template folder under a name (again to update it)")
+    add.add_argument("name", help="Template name")
+    add.add_argument("source", help="Folder with config.xml, package.json, www/ and res/")
+    template_sub.add_parser("list", help="List registered templates")
+    remove = template_sub.add_parser("remove", help="Forget a template")
+    remove.add_argument("name", help="Template name")
+    template.set_defaults(func=cmd_template)
+
+    export = sub.add_parser("export", help="Pack a wrapped project into a reproducible zip, tar.gz or tar archive")
+    export.add_argument("project", help="Wrapped project folder")
+    export.add_argument("archive", help="Archive to write (.zip, .tar.gz or .tar)")
+    export.add_argument("--format", choices=builder_export.EXPORT_FORMATS, help="Archive format (default: from the name)")
+    export.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="Also leave out files matching PATTERN, by name or path (repeatable)")
+    export.add_argument("--no-default-excludes", action="store_true",
+                        help=f"Include {', '.join(builder_export.DEFAULT_EXCLUDES[:2])} and the builder's state files")
+    export.add_argument("--level", type=int, choices=range(1, 10), default=6, metavar="1-9", help="Compression level")
+    export.add_argument("--workers", type=int, help="Compression threads (default: one per core)")
+    export.set_defaults(func=cmd_export)
+
+    watch = sub.add_parser("watch", help="Sync edits of a site into its wrapped project as they happen (Ctrl+C stops)")
+    watch.add_argument("target_dir", help="Website folder to watch")
+    watch.add_argument("dest_dir", help="Project wrapped from it")
+    watch.add_argument("--link-mode", choices=builder_fs.LINK_MODES, default="copy",
+                       help="How site files are placed in www/site")
+    watch.add_argument("--prepare", action="store_true", help="Run cordova prepare after every sync")
+    watch.add_argument("--poll", action="store_true", help="Poll for changes instead of using inotify")
+    watch.set_defaults(func=cmd_watch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,652 @@
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import hashlib
+import secrets
+import argparse
+import threading
+import http.client
+import http.server
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import builder_logic
+import builder_fs
+import builder_cli
+import builder_templates
+
+# host:port for localhost HTTP, or unix:/path for a Unix socket. By default
+# a socket in the cache folder, where only the daemon's user can connect.
+SOCKET_NAME = "daemon.sock"
+TCP_ADDRESS = "127.0.0.1:8765"
+# Events kept per job for clients that connect late
+JOB_EVENTS_KEEP = 10000
+# Finished jobs remembered for status queries
+JOB_HISTORY = 100
+# Seconds a streaming client waits before the daemon checks the job again
+STREAM_WAIT = 15
+
+
+def default_address():
+    if os.environ.get("CORDOVA_WRAP_DAEMON"):
+        return os.environ["CORDOVA_WRAP_DAEMON"]
+    if not hasattr(socket, "AF_UNIX"):
+        return TCP_ADDRESS
+    return "unix:" + os.path.join(builder_fs.default_cache_dir(), SOCKET_NAME)
+
+
+def token_path(address, cache_dir=None):
+    # Per address, so daemons on different addresses don't overwrite each other's token
+    key = hashlib.sha256(address.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir or builder_fs.default_cache_dir(), f"daemon-{key}.token")
+
+
+def write_token(path):
+    # New random token in a file only the daemon's user can read
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    os.replace(tmp_path, path)
+    return token
+
+
+def read_token(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def parse_address(address):
+    # ("unix", path) or ("tcp", (host, port))
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if address.startswith(("/", ".")):
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class DaemonJob:
+    def __init__(self, job_id, spec, events_lock):
+        self.id = job_id
+        self.spec = spec
+        self.name = spec["name"]
+        self.status = "queued"
+        self.percent = 0
+        self.step = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.builder = None
+        self.future = None
+        self.cancel_requested = False
+        self.events = []
+        self.first_seq = 0
+        self.changed = events_lock
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def add_event(self, kind, **fields):
+        with self.changed:
+            self.events.append(dict(fields, seq=self.first_seq + len(self.events), type=kind, time=time.time()))
+            if len(self.events) > JOB_EVENTS_KEEP:
+                drop = len(self.events) - JOB_EVENTS_KEEP
+                del self.events[:drop]
+                self.first_seq += drop
+            self.changed.notify_all()
+
+    def events_since(self, seq):
+        with self.changed:
+            return self.events[max(0, seq - self.first_seq):]
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "percent": self.percent,
+            "step": self.step,
+            "target_dir": self.spec["target_dir"],
+            "dest_dir": self.spec["dest_dir"],
+            "created": self.created,
+            "duration": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+        }
+
+
+class WrapDaemon:
+    """Runs wrap jobs for clients, keeping state warm between them.
+
+    The toolchain is checked once at startup, and all jobs share one copy
+    engine, template registry (with its snapshot file lists) and cache
+    folder. The manifest of each output folder stays in memory after a
+    wrap, so an incremental rebuild does not read it again.
+    """
+
+    def __init__(self, workers=2, cache_dir=None, log=None):
+        self.cache_dir = cache_dir or builder_fs.default_cache_dir()
+        self.log = log or (lambda message: sys.stderr.write(message + "\n"))
+        self.engine = builder_fs.CopyEngine()
+        self.templates = builder_templates.TemplateRegistry(self.cache_dir, self.engine)
+        self.manifests = {}
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()
+        self.started = time.time()
+
+        probe = builder_logic.CordovaWrapperBuilder(log_callback=self.log, cache_dir=self.cache_dir)
+        self.dependencies_ok = probe.check_dependencies()
+        self.toolchain = probe.toolchain
+        self.tool_versions = probe.tool_versions
+
+    def status(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "dependencies_ok": self.dependencies_ok,
+            "toolchain": self.toolchain["paths"] if self.toolchain else None,
+            "tool_versions": self.tool_versions,
+            "manifests": len(self.manifests),
+            "jobs": {status: sum(1 for job in jobs if job.status == status)
+                     for status in ("queued", "running", "done", "failed", "cancelled")},
+        }
+
+    def submit(self, row):
+        # Returns the new job, raises ValueError for a bad job
+        spec = builder_cli.parse_job(row, "")
+        for field in ("target_dir", "dest_dir", "export"):
+            if field in spec and not os.path.isabs(spec[field]):
+                raise ValueError(f"{field} must be an absolute path")
+        if row.get("template_dir"):
+            if not os.path.isabs(row["template_dir"]):
+                raise ValueError("template_dir must be an absolute path")
+            spec["template_dir"] = row["template_dir"]
+        if row.get("export_excludes"):
+            spec["export_excludes"] = [str(pattern) for pattern in row["export_excludes"]]
+        dest = os.path.abspath(spec["dest_dir"])
+
+        with self.lock:
+            if any(job.active and os.path.abspath(job.spec["dest_dir"]) == dest for job in self.jobs.values()):
+                raise ValueError(f"A job for {dest} is already queued or running")
+            job = DaemonJob(self.next_id, spec, self.changed)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            finished = [old.id for old in self.jobs.values() if not old.active]
+            for old_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+                del self.jobs[old_id]
+            job.add_event("status", status=job.status)
+            job.future = self.pool.submit(self.run_job, job)
+        self.log(f"Job {job.id} ({job.name}) queued")
+        return job
+
+    def run_job(self, job):
+        if job.cancel_requested:
+            return
+        builder = builder_logic.CordovaWrapperBuilder(
+            progress_callback=lambda percent, step: self.on_progress(job, percent, step),
+            log_callback=lambda message, level: job.add_event("log", level=level, message=message),
+            log_levels=True, copy_engine=self.engine, cache_dir=self.cache_dir
+        )
+        # Warm state shared by all jobs
+        builder.templates = self.templates
+        builder.manifests = self.manifests
+        builder.toolchain = self.toolchain
+        builder.tool_versions = dict(self.tool_versions)
+        job.builder = builder
+
+        job.status = "running"
+        job.started = time.time()
+        job.add_event("status", status=job.status)
+        spec = job.spec
+        try:
+            success = builder.wrap_project(
+                spec["target_dir"], spec["dest_dir"], spec["app_name"], spec["app_id"], spec["app_version"],
+                overwrite=spec.get("overwrite", False),
+                incremental=spec.get("incremental", False),
+                link_mode=spec.get("link_mode", "copy"),
+                optimize=spec.get("optimize", False),
+                optimize_images=spec.get("optimize_images", False),
+                bundle_js=spec.get("bundle_js", False),
+                template_dir=spec.get("template_dir"),
+                template=spec.get("template"),
+                platforms=spec.get("platforms"),
+                preflight=spec.get("preflight", True),
+                strict_preflight=spec.get("strict_preflight", False),
+                dedupe=spec.get("dedupe", False),
+                export_path=spec.get("export"),
+                export_excludes=spec.get("export_excludes"),
+                check_deps=not self.dependencies_ok
+            )
+        except Exception as e:
+            builder.log(f"Exception: {e}")
+            success = False
+        job.finished = time.time()
+        if builder.aborted or job.cancel_requested:
+            job.status = "cancelled"
+        else:
+            job.status = "done" if success else "failed"
+        job.add_event("status", status=job.status, duration=round(job.finished - job.started, 3),
+                      profile=builder.profile.summary_lines(), platforms=builder.platform_results)
+        self.log(f"Job {job.id} ({job.name}) {job.status} in {job.finished - job.started:.1f}s")
+
+    def on_progress(self, job, percent, step):
+        job.percent = percent
+        job.step = step
+        job.add_event("progress", percent=percent, step=step)
+
+    def cancel(self, job):
+        if not job.active or job.cancel_requested:
+            return
+        job.cancel_requested = True
+        if job.future.cancel():
+            job.status = "cancelled"
+            job.add_event("status", status=job.status)
+        elif job.builder is not None:
+            # Stopping the running command may take a few seconds
+            threading.Thread(target=job.builder.cancel, daemon=True).start()
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            self.cancel(job)
+        self.pool.shutdown(wait=True)
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """JSON job API.
+
+    GET    /status                  daemon state
+    GET    /jobs                    all jobs
+    POST   /jobs                    submit a job (a batch manifest row as JSON)
+    GET    /jobs/<id>               one job
+    GET    /jobs/<id>/events        its events as JSON lines, from ?since=<seq>;
+                                    with ?follow=1 until the job has finished
+    DELETE /jobs/<id>               cancel a job
+    POST   /shutdown                cancel all jobs and stop
+    """
+
+    server_version = "CordovaWrapDaemon/1"
+
+    def check_request(self):
+        # Browsers send an Origin header and can't set Authorization on a
+        # simple cross-site request, other local users don't have the token
+        if self.headers.get("Origin") is not None:
+            self.send_json(403, {"error": "Cross-origin requests are not allowed"})
+            return False
+        if not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.server.token}"):
+            self.send_json(401, {"error": "Missing or wrong token"})
+            return False
+        if self.command == "POST" and self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            self.send_json(415, {"error": "Expected Content-Type: application/json"})
+            return False
+        return True
+
+    @property
+    def daemon(self):
+        return self.server.wrap_daemon
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            self.daemon.log(f"{self.address_string()} {format % args}")
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def find_job(self, parts):
+        try:
+            job = self.daemon.jobs.get(int(parts[1]))
+        except ValueError:
+            job = None
+        if job is None:
+            self.send_json(404, {"error": f"No job {parts[1]}"})
+        return job
+
+    def do_GET(self):
+        if not self.check_request():
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["status"]:
+            self.send_json(200, self.daemon.status())
+        elif parts == ["jobs"]:
+            self.send_json(200, [job.summary() for job in list(self.daemon.jobs.values())])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.find_job(parts)
+            if job:
+                self.send_json(200, job.summary())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self.find_job(parts)
+            if job:
+                query = parse_qs(url.query)
+                self.stream_events(job, int(query.get("since", ["0"])[0]), query.get("follow", ["0"])[0] == "1")
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if not self.check_request():
+            return
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts == ["jobs"]:
+            try:
+                row = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+                job = self.daemon.submit(row)
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.send_json(202, job.summary())
+        elif parts == ["shutdown"]:
+            self.send_json(202, {"status": "stopping"})
+            threading.Thread(target=self.server.stop, daemon=True).start()
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_DELETE(self):
+        if not self.check_request():
+            return
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.find_job(parts)
+            if job:
+                self.daemon.cancel(job)
+                self.send_json(202, job.summary())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def stream_events(self, job, since, follow):
+        # HTTP/1.0 response without a length, ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        while True:
+            with job.changed:
+                job.changed.wait_for(lambda: job.first_seq + len(job.events) > since or not job.active,
+                                     timeout=STREAM_WAIT)
+            events = job.events_since(since)
+            if events:
+                self.wfile.write("".join(json.dumps(event) + "\n" for event in events).encode('utf-8'))
+                self.wfile.flush()
+                since = events[-1]["seq"] + 1
+            elif not follow or not job.active:
+                return
+
+
+class DaemonServerMixin:
+    daemon_threads = True
+    verbose = False
+
+    def stop(self):
+        self.wrap_daemon.shutdown()
+        self.shutdown()
+
+
+class TCPDaemonServer(DaemonServerMixin, http.server.ThreadingHTTPServer):
+    pass
+
+
+class UnixDaemonServer(DaemonServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        os.makedirs(os.path.dirname(self.server_address) or ".", exist_ok=True)
+        super().server_bind()
+        # Only the user running the daemon may submit jobs
+        os.chmod(self.server_address, 0o600)
+
+
+def create_server(address, wrap_daemon, verbose=False):
+    kind, target = parse_address(address)
+    server = (UnixDaemonServer if kind == "unix" else TCPDaemonServer)(target, RequestHandler)
+    server.wrap_daemon = wrap_daemon
+    server.verbose = verbose
+    server.token_path = token_path(address, wrap_daemon.cache_dir)
+    server.token = write_token(server.token_path)
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    def __init__(self, address=None, timeout=None, token=None):
+        address = address or default_address()
+        self.kind, self.target = parse_address(address)
+        self.timeout = timeout
+        # Written by the daemon when it starts
+        self.token = token or read_token(token_path(address)) or ""
+
+    def headers(self):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {self.token}"}
+
+    def connect(self):
+        if self.kind == "unix":
+            return UnixHTTPConnection(self.target, timeout=self.timeout)
+        return http.client.HTTPConnection(*self.target, timeout=self.timeout)
+
+    def request(self, method, path, data=None):
+        # Returns the decoded JSON answer, raises RuntimeError for errors
+        conn = self.connect()
+        try:
+            body = json.dumps(data).encode('utf-8') if data is not None else None
+            conn.request(method, path, body=body, headers=self.headers())
+            response = conn.getresponse()
+            result = json.loads(response.read() or b"null")
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise RuntimeError(result.get("error") if isinstance(result, dict) else response.reason)
+        return result
+
+    def events(self, job_id, since=0, follow=True):
+        # Yields the job's events as they happen
+        conn = self.connect()
+        try:
+            conn.request("GET", f"/jobs/{job_id}/events?since={since}&follow={int(follow)}", headers=self.headers())
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise RuntimeError(json.loads(response.read()).get("error"))
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+
+def cmd_serve(args):
+    wrap_daemon = WrapDaemon(workers=args.workers)
+    if not wrap_daemon.dependencies_ok:
+        sys.stderr.write("Warning: dependency check failed, jobs will check again.\n")
+    server = create_server(args.address, wrap_daemon, verbose=args.verbose)
+    sys.stderr.write(f"Listening on {args.address} with {args.workers} workers\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        wrap_daemon.shutdown()
+    finally:
+        server.server_close()
+        if isinstance(server, UnixDaemonServer) and os.path.exists(server.server_address):
+            os.remove(server.server_address)
+        if os.path.exists(server.token_path):
+            os.remove(server.token_path)
+    return builder_cli.EXIT_OK
+
+
+def follow_job(client, job, lock):
+    # Prints a job's log and returns its final status
+    status = job["status"]
+    for event in client.events(job["id"]):
+        if event["type"] == "log":
+            line = f"[{job['name']}] {event['message']}"
+        elif event["type"] == "status":
+            status = event["status"]
+            line = f"[{job['name']}] {status}" + (f" ({event['duration']}s)" if "duration" in event else "")
+        else:
+            continue
+        with lock:
+            sys.stderr.write(line + "\n")
+    return status
+
+
+def cmd_submit(args):
+    try:
+        jobs = builder_cli.load_jobs(args.manifest)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Could not read manifest: {e}\n")
+        return builder_cli.EXIT_USAGE
+    defaults = {"overwrite": args.overwrite, "incremental": args.incremental, "link_mode": args.link_mode,
+                "optimize": args.minify, "optimize_images": args.optimize_images, "bundle_js": args.bundle_js,
+                "dedupe": args.dedupe, "platforms": builder_logic.parse_platforms(args.platforms)}
+    if args.template:
+        if os.path.isdir(args.template):
+            defaults["template_dir"] = os.path.abspath(args.template)
+        else:
+            defaults["template"] = args.template
+
+    client = DaemonClient(args.address)
+    submitted = []
+    try:
+        for job in jobs:
+            for key, value in defaults.items():
+                job.setdefault(key, value)
+            submitted.append(client.request("POST", "/jobs", job))
+            print(f"{submitted[-1]['id']}\t{job['name']}")
+    except (OSError, RuntimeError) as e:
+        sys.stderr.write(f"Could not submit: {e}\n")
+        return builder_cli.EXIT_JOB_FAILED
+    if not args.follow:
+        return builder_cli.EXIT_OK
+
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=len(submitted) or 1) as pool:
+        statuses = list(pool.map(lambda job: follow_job(client, job, lock), submitted))
+    return builder_cli.EXIT_OK if all(status == "done" for status in statuses) else builder_cli.EXIT_JOB_FAILED
+
+
+def cmd_jobs(args):
+    client = DaemonClient(args.address)
+    try:
+        if args.job:
+            print(json.dumps(client.request("GET", f"/jobs/{args.job}"), indent=2))
+        else:
+            for job in client.request("GET", "/jobs"):
+                duration = f"{job['duration']}s" if job["duration"] is not None else ""
+                print(f"{job['id']:>4}  {job['status']:<9} {job['percent']:>3}%  {duration:>9}  {job['name']}")
+    except (OSError, RuntimeError) as e:
+        sys.stderr.write(f"{e}\n")
+        return builder_cli.EXIT_JOB_FAILED
+    return builder_cli.EXIT_OK
+
+
+def cmd_status(args):
+    try:
+        print(json.dumps(DaemonClient(args.address).request("GET", "/status"), indent=2))
+    except (OSError, RuntimeError) as e:
+        sys.stderr.write(f"Daemon not reachable at {args.address}: {e}\n")
+        return builder_cli.EXIT_JOB_FAILED
+    return builder_cli.EXIT_OK
+
+
+def cmd_cancel(args):
+    try:
+        DaemonClient(args.address).request("DELETE", f"/jobs/{args.job}")
+    except (OSError, RuntimeError) as e:
+        sys.stderr.write(f"{e}\n")
+        return builder_cli.EXIT_JOB_FAILED
+    return builder_cli.EXIT_OK
+
+
+def cmd_stop(args):
+    try:
+        DaemonClient(args.address).request("POST", "/shutdown")
+    except (OSError, RuntimeError) as e:
+        sys.stderr.write(f"{e}\n")
+        return builder_cli.EXIT_JOB_FAILED
+    return builder_cli.EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Cordova App Wrapper build daemon and client")
+    parser.add_argument("--address", default=default_address(),
+                        help="unix:/path/to/socket or host:port (default: $CORDOVA_WRAP_DAEMON or a socket "
+                             "in the cache folder)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the daemon")
+    serve.add_argument("-w", "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                       help="Number of jobs run concurrently")
+    serve.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    serve.set_defaults(func=cmd_serve)
+
+    submit = sub.add_parser("submit", help="Submit the jobs of a batch manifest (JSON or CSV)")
+    submit.add_argument("manifest", help="JSON or CSV file with target_dir, dest_dir, app_name, app_id, app_version")
+    submit.add_argument("-f", "--follow", action="store_true", help="Print the job logs and wait for the jobs to finish")
+    submit.add_argument("--template", help="Registered template name or template project folder")
+    submit.add_argument("--overwrite", action="store_true", help="Replace existing output folders")
+    submit.add_argument("--incremental", action="store_true", help="Only sync changed files into existing projects")
+    submit.add_argument("--link-mode", choices=builder_fs.LINK_MODES, default="copy",
+                        help="How site files are placed in www/site")
+    submit.add_argument("--minify", action="store_true", help="Minify the HTML, CSS and JS of the sites")
+    submit.add_argument("--bundle-js", action="store_true", help="Bundle the app's own scripts into one minified file")
+    submit.add_argument("--optimize-images", action="store_true", help="Recompress PNG images losslessly")
+    submit.add_argument("--dedupe", action="store_true", help="Hardlink site files with identical content")
+    submit.add_argument("--platforms", default="android",
+                        help="Comma-separated Cordova platforms to add (e.g. android,browser)")
+    submit.set_defaults(func=cmd_submit)
+
+    jobs = sub.add_parser("jobs", help="List jobs, or show one")
+    jobs.add_argument("job", nargs="?", help="Job id")
+    jobs.set_defaults(func=cmd_jobs)
+
+    status = sub.add_parser("status", help="Show the daemon's state")
+    status.set_defaults(func=cmd_status)
+
+    cancel = sub.add_parser("cancel", help="Cancel a job")
+    cancel.add_argument("job", help="Job id")
+    cancel.set_defaults(func=cmd_cancel)
+
+    stop = sub.add_parser("stop", help="Cancel all jobs and stop the daemon")
+    stop.set_defaults(func=cmd_stop)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
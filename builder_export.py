@@ -0,0 +1,300 @@
+import os
+import io
+import gzip
+import time
+import zlib
+import struct
+import fnmatch
+import tarfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import builder_fs
+
+EXPORT_FORMATS = ("zip", "tar.gz", "tar")
+# Rebuilt from config.xml and package.json on the build machine, or only
+# meaningful to the builder itself
+DEFAULT_EXCLUDES = ("node_modules", "platforms", ".platform-work", builder_fs.MANIFEST_NAME,
+                    builder_fs.FINGERPRINT_NAME, ".DS_Store", "Thumbs.db")
+# Already compressed, stored as they are in zip archives
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".mp3", ".mp4", ".m4a", ".ogg",
+                     ".webm", ".woff", ".woff2", ".zip", ".gz", ".jar", ".apk", ".aab")
+# Timestamp of every entry unless SOURCE_DATE_EPOCH is set: the earliest
+# time a zip file can hold (1980-01-01)
+DEFAULT_EPOCH = 315532800
+# The tar stream is compressed in blocks of this size, one gzip member each
+GZIP_BLOCK_SIZE = 1024 * 1024
+# Bytes of file data read ahead of the writer
+READ_AHEAD = 64 * 1024 * 1024
+ZIP_LIMIT = 0xFFFFFFFF
+
+
+class ExportError(Exception):
+    pass
+
+
+def archive_format(path):
+    # Format from the archive's file name
+    name = path.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar.gz"
+    if name.endswith(".tar"):
+        return "tar"
+    raise ExportError(f"Unknown archive type '{os.path.basename(path)}', use one of: "
+                      f"{', '.join('.' + fmt for fmt in EXPORT_FORMATS)}")
+
+
+def source_epoch():
+    try:
+        return max(int(os.environ["SOURCE_DATE_EPOCH"]), DEFAULT_EPOCH)
+    except (KeyError, ValueError):
+        return DEFAULT_EPOCH
+
+
+def ignore_patterns(root, patterns):
+    # scan_tree ignore callable matching each pattern against names and
+    # paths relative to root, so "www/site/*.map" works as well as "*.map"
+    def ignore(directory, names):
+        rel_dir = os.path.relpath(directory, root).replace(os.sep, "/")
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        return {name for name in names
+                if any(fnmatch.fnmatchcase(name, p) or fnmatch.fnmatchcase(prefix + name, p) for p in patterns)}
+    return ignore
+
+
+def list_project(project_dir, excludes=DEFAULT_EXCLUDES):
+    # Sorted [(rel path, stat or None for directories)]. Excluded folders
+    # are not walked at all.
+    dirs = []
+    files = builder_fs.scan_tree(project_dir, ignore_patterns(project_dir, excludes), dirs)
+    entries = [(rel, st) for rel, st in files.items()] + [(rel, None) for rel in dirs]
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def _mode(st):
+    return 0o755 if st is None or st.st_mode & 0o111 else 0o644
+
+
+def _read_ahead(pool, func, items, sizes):
+    # Yields func(item) in order, with at most READ_AHEAD bytes of items
+    # being worked on at once (but always at least one)
+    pending = deque()
+    queued = 0
+    items = iter(zip(items, sizes))
+    done = False
+    while True:
+        while not done and (not pending or queued < READ_AHEAD):
+            item = next(items, None)
+            if item is None:
+                done = True
+                break
+            pending.append((pool.submit(func, item[0]), item[1]))
+            queued += item[1]
+        if not pending:
+            return
+        future, size = pending.popleft()
+        queued -= size
+        yield future.result()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Write-only file that gzips what it is given on a thread pool.
+
+    The stream is cut into GZIP_BLOCK_SIZE blocks, each compressed into a
+    gzip member of its own (like pigz). Concatenated members are a valid
+    gzip file, and with mtime 0 the output only depends on the input.
+    """
+
+    def __init__(self, fileobj, pool, level=6):
+        self.fileobj = fileobj
+        self.pool = pool
+        self.level = level
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.blocks = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= GZIP_BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:GZIP_BLOCK_SIZE]))
+            del self.buffer[:GZIP_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block):
+        self.pending.append(self.pool.submit(gzip.compress, block, self.level, mtime=0))
+        self.blocks += 1
+        while len(self.pending) > READ_AHEAD // GZIP_BLOCK_SIZE:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer or not self.blocks:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().result())
+        super().close()
+
+
+def _write_tar(out, project_dir, entries, pool, compress, level, progress):
+    epoch = source_epoch()
+    stream = ParallelGzipWriter(out, pool, level) if compress else out
+    total = len(entries)
+    with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        # Files with the same inode (deduplicated site files) become hardlinks
+        inodes = {}
+        for index, (rel, st) in enumerate(entries):
+            info = tarfile.TarInfo(rel)
+            info.mtime = epoch
+            info.mode = _mode(st)
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            if st is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif st.st_nlink > 1 and (st.st_dev, st.st_ino) in inodes:
+                info.type = tarfile.LNKTYPE
+                info.linkname = inodes[(st.st_dev, st.st_ino)]
+                tar.addfile(info)
+            else:
+                if st.st_nlink > 1:
+                    inodes[(st.st_dev, st.st_ino)] = rel
+                info.size = st.st_size
+                with open(os.path.join(project_dir, rel), 'rb') as f:
+                    tar.addfile(info, f)
+            if progress:
+                progress(index + 1, total)
+    if compress:
+        stream.close()
+
+
+def _deflate_file(path, level):
+    # (crc, raw deflate data) of a file
+    crc = 0
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    chunks = []
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(builder_fs.HASH_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return crc, b"".join(chunks)
+
+
+def _crc_file(path):
+    # (crc, None) of a file that is stored uncompressed
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(builder_fs.HASH_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc, None
+
+
+def _write_zip(out, project_dir, entries, pool, level, progress):
+    # Written by hand rather than with zipfile, so members can be
+    # compressed in parallel. Every header field is fixed or derived from
+    # the content, which keeps the archive reproducible.
+    t = time.gmtime(source_epoch())
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+    def compress(entry):
+        rel, st = entry
+        if st is None:
+            return 0, b""
+        path = os.path.join(project_dir, rel)
+        if rel.lower().endswith(STORED_EXTENSIONS) or not st.st_size:
+            return _crc_file(path)
+        return _deflate_file(path, level)
+
+    central = []
+    offset = 0
+    results = _read_ahead(pool, compress, entries, [st.st_size if st else 0 for _, st in entries])
+    for index, ((rel, st), (crc, data)) in enumerate(zip(entries, results)):
+        name = rel + "/" if st is None else rel
+        encoded = name.encode('utf-8')
+        flags = 0x800 if not name.isascii() else 0
+        size = st.st_size if st else 0
+        if data is not None and len(data) >= size:
+            # Did not get smaller
+            data = None
+        method = 0 if data is None else 8
+        compressed = size if data is None else len(data)
+        if offset > ZIP_LIMIT or size > ZIP_LIMIT or len(central) >= 0xFFFF:
+            raise ExportError("The project is too large for a zip archive, export a .tar.gz instead")
+
+        out.write(struct.pack("<IHHHHHIIIHH", 0x04034b50, 20, flags, method, dos_time, dos_date,
+                              crc, compressed, size, len(encoded), 0))
+        out.write(encoded)
+        if data is not None:
+            out.write(data)
+        elif size:
+            # Stored members are copied straight from the file
+            with open(os.path.join(project_dir, rel), 'rb') as f:
+                for chunk in iter(lambda: f.read(builder_fs.HASH_CHUNK_SIZE), b''):
+                    out.write(chunk)
+        attributes = ((0o40000 if st is None else 0o100000) | _mode(st)) << 16 | (0x10 if st is None else 0)
+        central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, 0x0314, 20, flags, method, dos_time,
+                                   dos_date, crc, compressed, size, len(encoded), 0, 0, 0, 0,
+                                   attributes, offset) + encoded)
+        offset += 30 + len(encoded) + compressed
+        if progress:
+            progress(index + 1, len(entries))
+
+    directory = b"".join(central)
+    if offset > ZIP_LIMIT:
+        raise ExportError("The project is too large for a zip archive, export a .tar.gz instead")
+    out.write(directory)
+    out.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, len(central), len(central), len(directory), offset, 0))
+
+
+def export_project(project_dir, archive_path, fmt=None, excludes=DEFAULT_EXCLUDES, workers=None, level=6,
+                   progress=None):
+    """Pack project_dir into a zip, tar.gz or tar archive.
+
+    Entries are sorted and get fixed timestamps, owners and permissions,
+    so the same files always give a byte-identical archive. Compression
+    runs on `workers` threads. The archive is written next to
+    archive_path and renamed into place. Returns a dict with the number
+    of "files", their "size", the "archive_size" and the "format".
+    progress(done, total) is called per entry.
+    """
+    fmt = fmt or archive_format(archive_path)
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown archive format '{fmt}', use one of: {', '.join(EXPORT_FORMATS)}")
+    project_dir = os.path.abspath(project_dir)
+    archive_path = os.path.abspath(archive_path)
+    if archive_path.startswith(project_dir + os.sep):
+        # Would end up inside itself
+        excludes = tuple(excludes) + (os.path.relpath(archive_path, project_dir).replace(os.sep, "/"),)
+    entries = list_project(project_dir, excludes)
+
+    out_dir = os.path.dirname(archive_path)
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".export-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out, ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+            if fmt == "zip":
+                _write_zip(out, project_dir, entries, pool, level, progress)
+            else:
+                _write_tar(out, project_dir, entries, pool, fmt == "tar.gz", level, progress)
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    files = [st for _, st in entries if st is not None]
+    return {
+        "files": len(files),
+        "size": sum(st.st_size for st in files),
+        "archive_size": os.path.getsize(archive_path),
+        "format": fmt,
+    }
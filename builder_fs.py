@@ -0,0 +1,505 @@
+import os
+import shutil
+import hashlib
+import json
+import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Name of the manifest kept in the root of every wrapped project
+MANIFEST_NAME = ".wrap_manifest.json"
+MANIFEST_VERSION = 1
+# Fingerprints of the inputs of npm install / cordova platform add
+FINGERPRINT_NAME = ".wrap_fingerprint.json"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files at least this large are copied in-kernel and get a worker of their own,
+# smaller ones are grouped into batches to keep per-task overhead down
+LARGE_FILE_SIZE = 1024 * 1024
+BATCH_MAX_FILES = 64
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+KERNEL_COPY_CHUNK = 64 * 1024 * 1024
+
+# How files are materialised in the destination. When a mode does not work on
+# the filesystem at hand, the next entry of LINK_FALLBACKS is tried.
+LINK_MODES = ("copy", "reflink", "hardlink", "symlink")
+LINK_FALLBACKS = {
+    "symlink": "hardlink",
+    "hardlink": "reflink",
+    "reflink": "copy",
+}
+
+# ioctl request number for cloning a file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Cancelled(Exception):
+    # Raised from a progress callback to stop a copy early
+    pass
+
+
+def default_cache_dir():
+    # Shared on-disk cache for everything that outlives a single wrap
+    if os.environ.get("CORDOVA_WRAP_CACHE"):
+        return os.environ["CORDOVA_WRAP_CACHE"]
+    if sys.platform == 'win32' and os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "cordova-web-wrap", "cache")
+    return os.path.join(os.path.expanduser("~"), ".cache", "cordova-web-wrap")
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data, indent=None):
+    # Write to a temp file next to path and swap it in, so concurrent readers
+    # (other jobs, other processes) never see a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def scan_tree(root, ignore=None, dirs=None):
+    """Walk root and return a dict of relative posix path -> os.stat_result.
+
+    `ignore` has the same signature as the callable produced by
+    shutil.ignore_patterns, so the template ignore list can be reused.
+    Relative directory paths are appended to `dirs` when given.
+    """
+    files = {}
+    stack = [("", root)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        with os.scandir(abs_dir) as it:
+            entries = list(it)
+        ignored = ignore(abs_dir, [e.name for e in entries]) if ignore else ()
+        for entry in entries:
+            if entry.name in ignored:
+                continue
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=True):
+                stack.append((rel, entry.path))
+                if dirs is not None:
+                    dirs.append(rel)
+            else:
+                files[rel] = entry.stat(follow_symlinks=True)
+    return files
+
+
+def find_duplicates(root, engine=None):
+    """Groups of files with identical content under root.
+
+    Returns [(size, [rel paths])], the group wasting the most bytes first.
+    Only files that share their size with another file are hashed.
+    """
+    engine = engine or CopyEngine()
+    files = scan_tree(root)
+    by_size = {}
+    for rel, st in files.items():
+        if st.st_size:
+            by_size.setdefault(st.st_size, []).append(rel)
+    candidates = sorted(rel for rels in by_size.values() if len(rels) > 1 for rel in rels)
+    digests = engine.map(lambda rel: hash_file(os.path.join(root, rel)), candidates)
+
+    groups = {}
+    for rel, digest in zip(candidates, digests):
+        groups.setdefault((files[rel].st_size, digest), []).append(rel)
+    duplicates = [(size, rels) for (size, _), rels in groups.items() if len(rels) > 1]
+    duplicates.sort(key=lambda group: (-group[0] * (len(group[1]) - 1), group[1][0]))
+    return duplicates
+
+
+def link_duplicates(root, groups):
+    # Replaces every file of a group after the first by a hardlink to the
+    # first. Returns (files linked, bytes saved) and raises OSError where
+    # the filesystem can't hardlink.
+    linked = saved = 0
+    for size, rels in groups:
+        first = os.path.join(root, rels[0])
+        first_st = os.stat(first)
+        for rel in rels[1:]:
+            path = os.path.join(root, rel)
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) == (first_st.st_dev, first_st.st_ino):
+                continue
+            tmp = path + ".dedupe-tmp"
+            _remove_file(tmp)
+            os.link(first, tmp)
+            os.replace(tmp, path)
+            linked += 1
+            saved += size
+    return linked, saved
+
+
+def unshare_files(paths):
+    # Replaces each existing file by a real copy of its content, for files
+    # that were linked from a shared store but get rewritten in place
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.remove(path)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+
+def remove_empty_dirs(root, rel_paths):
+    # Walk up from each removed file and drop directories that became empty
+    for rel in sorted(rel_paths, key=lambda p: -p.count('/')):
+        parent = os.path.dirname(rel)
+        while parent:
+            path = os.path.join(root, parent)
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+
+class FileManifest:
+    """Per-file size/mtime/hash record of what was synced into a project.
+
+    Entries are grouped in sections (e.g. "template" and "site"), each mapping
+    a relative path to {"size", "mtime", "hash"} of the *source* file, plus
+    the requested "link" mode when the file was not simply copied.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.sections = data.get("sections", {})
+        self.inputs = data.get("inputs", {})
+
+    @classmethod
+    def load(cls, project_dir):
+        data = read_json(os.path.join(project_dir, MANIFEST_NAME))
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data)
+
+    def save(self, project_dir):
+        write_json(os.path.join(project_dir, MANIFEST_NAME), {
+            "version": MANIFEST_VERSION,
+            "sections": self.sections,
+            "inputs": self.inputs,
+        })
+
+    def section(self, name):
+        return self.sections.setdefault(name, {})
+
+
+class SyncStats:
+    def __init__(self):
+        self.copied = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.bytes_copied = 0
+        self.link_mode = "copy"
+        # Relative paths of the files that were copied
+        self.changed = []
+
+    def __str__(self):
+        return (f"{self.copied} copied, {self.unchanged} unchanged, "
+                f"{self.deleted} deleted ({self.bytes_copied} bytes, {self.link_mode})")
+
+
+def sync_tree(src_root, dest_root, entries, ignore=None, force=(), engine=None, progress=None,
+              link_mode="copy", on_copied=None):
+    """Bring dest_root in line with src_root, touching only what changed.
+
+    `entries` is the manifest section recorded by the previous sync and is
+    updated in place. Files listed in `force` are always copied. Files in
+    dest_root that were never synced by us are left alone. Stages that
+    rewrite synced files record the result in the entry as "dest" (new
+    relative path) and "dest_size".
+    """
+    current = scan_tree(src_root, ignore)
+    return _sync_files(src_root, dest_root, entries, current, list(entries), force, engine, progress,
+                       link_mode, on_copied)
+
+
+def sync_paths(src_root, dest_root, entries, rel_paths, engine=None, link_mode="copy", on_copied=None):
+    """Like sync_tree, limited to rel_paths (files or folders) that changed.
+
+    Paths that no longer exist in src_root are deleted from dest_root,
+    folders are synced with everything below them. "" stands for the
+    whole tree.
+    """
+    if "" in rel_paths:
+        return sync_tree(src_root, dest_root, entries, engine=engine, link_mode=link_mode, on_copied=on_copied)
+    current = {}
+    scope = set()
+    for rel in rel_paths:
+        prefix = rel + "/"
+        scope.update(entry for entry in entries if entry == rel or entry.startswith(prefix))
+        path = os.path.join(src_root, rel)
+        if os.path.isdir(path):
+            current.update((prefix + sub, st) for sub, st in scan_tree(path).items())
+        elif os.path.isfile(path):
+            current[rel] = os.stat(path)
+    return _sync_files(src_root, dest_root, entries, current, scope, (), engine, None, link_mode, on_copied)
+
+
+def _sync_files(src_root, dest_root, entries, current, scope, force, engine, progress, link_mode, on_copied):
+    # Copies the files of current ({rel: stat}) that differ from entries and
+    # deletes the files of scope that are not in current
+    engine = engine or CopyEngine()
+    stats = SyncStats()
+
+    # Files whose stat differs from the manifest need their content hashed
+    candidates = []
+    for rel, st in current.items():
+        old = entries.get(rel)
+        dst_ok = (old is not None and rel not in force
+                  and old.get("link", "copy") == link_mode
+                  and _dest_matches(os.path.join(dest_root, old.get("dest", rel)), old.get("dest_size", old["size"])))
+        if dst_ok and old["size"] == st.st_size and old["mtime"] == st.st_mtime_ns:
+            stats.unchanged += 1
+        else:
+            candidates.append((rel, st, dst_ok))
+
+    digests = engine.map(lambda c: hash_file(os.path.join(src_root, c[0])), candidates)
+
+    jobs = []
+    for (rel, st, dst_ok), digest in zip(candidates, digests):
+        if dst_ok and entries[rel]["hash"] == digest:
+            # Touched but identical content, just refresh the recorded stat
+            # (keeping what later stages recorded about the destination)
+            stats.unchanged += 1
+            entries[rel].update(size=st.st_size, mtime=st.st_mtime_ns)
+            continue
+        if rel in entries and entries[rel].get("dest", rel) != rel:
+            _remove_file(os.path.join(dest_root, entries[rel]["dest"]))
+        jobs.append((os.path.join(src_root, rel), os.path.join(dest_root, rel), st.st_size))
+        stats.copied += 1
+        stats.bytes_copied += st.st_size
+        stats.changed.append(rel)
+        entries[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest}
+        if link_mode != "copy":
+            entries[rel]["link"] = link_mode
+
+    stats.link_mode = engine.copy_files(jobs, progress=progress, link_mode=link_mode, on_copied=on_copied)
+
+    removed = []
+    for rel in [rel for rel in scope if rel not in current]:
+        removed.append(entries.pop(rel).get("dest", rel))
+        _remove_file(os.path.join(dest_root, removed[-1]))
+        stats.deleted += 1
+    remove_empty_dirs(dest_root, removed)
+
+    return stats
+
+
+class CopyEngine:
+    """Thread pool file copier.
+
+    Anything with the same copy_tree / copy_files / map methods can be handed
+    to CordovaWrapperBuilder as its copy engine. `progress` callbacks are
+    called as progress(done_files, total_files) from the worker threads.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def map(self, func, items):
+        items = list(items)
+        if self.workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(func, items))
+
+    def copy_tree(self, src_root, dest_root, ignore=None, progress=None, link_mode="copy", on_copied=None):
+        # Equivalent of shutil.copytree(src_root, dest_root, ignore=ignore),
+        # returns the link mode that was actually used
+        dirs = []
+        files = scan_tree(src_root, ignore, dirs)
+        os.makedirs(dest_root, exist_ok=True)
+        for rel in dirs:
+            os.makedirs(os.path.join(dest_root, rel), exist_ok=True)
+
+        jobs = [(os.path.join(src_root, rel), os.path.join(dest_root, rel), st.st_size)
+                for rel, st in files.items()]
+        return self.copy_files(jobs, make_dirs=False, progress=progress, link_mode=link_mode,
+                               on_copied=on_copied)
+
+    def copy_files(self, jobs, make_dirs=True, progress=None, link_mode="copy", on_copied=None):
+        # jobs: list of (src, dst, size). Returns the link mode that was
+        # actually used after any fallbacks. on_copied(files, bytes, cpu) is
+        # called after every batch.
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        if not jobs:
+            return link_mode
+        if make_dirs:
+            for parent in {os.path.dirname(dst) for _, dst, _ in jobs}:
+                os.makedirs(parent, exist_ok=True)
+
+        total = len(jobs)
+        done = [0]
+        mode = [link_mode]
+        lock = threading.Lock()
+
+        def run_batch(batch):
+            cpu_start = time.thread_time()
+            copied = 0
+            for src, dst, size in batch:
+                current = mode[0]
+                while True:
+                    try:
+                        self.link_file(src, dst, size, current)
+                        break
+                    except OSError:
+                        if current == "copy":
+                            raise
+                    # Not supported here, degrade for this and all later files
+                    current = LINK_FALLBACKS[current]
+                    with lock:
+                        if LINK_MODES.index(current) < LINK_MODES.index(mode[0]):
+                            mode[0] = current
+                if progress:
+                    with lock:
+                        done[0] += 1
+                        count = done[0]
+                    progress(count, total)
+                copied += size
+            if on_copied:
+                on_copied(len(batch), copied, time.thread_time() - cpu_start)
+
+        batches = self._batches(jobs)
+        if self.workers == 1 or len(batches) == 1:
+            for batch in batches:
+                run_batch(batch)
+            return mode[0]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Surface the first error, if any
+            for future in [pool.submit(run_batch, batch) for batch in batches]:
+                future.result()
+        return mode[0]
+
+    def link_file(self, src, dst, size, link_mode="copy"):
+        # Never write through an existing destination, it may be a link
+        # into the source tree from an earlier run
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        if link_mode == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+        elif link_mode == "hardlink":
+            os.link(src, dst)
+        elif link_mode == "reflink":
+            try:
+                _reflink(src, dst)
+            except OSError:
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                raise
+        else:
+            self.copy_file(src, dst, size)
+
+    def copy_file(self, src, dst, size):
+        if size >= LARGE_FILE_SIZE:
+            _copy_large(src, dst)
+            shutil.copystat(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
+    def _batches(self, jobs):
+        # Largest files first so the big ones do not end up as stragglers
+        batches = []
+        batch, batch_bytes = [], 0
+        for job in sorted(jobs, key=lambda j: -j[2]):
+            if job[2] >= LARGE_FILE_SIZE:
+                batches.append([job])
+                continue
+            batch.append(job)
+            batch_bytes += job[2]
+            if len(batch) >= BATCH_MAX_FILES or batch_bytes >= BATCH_MAX_BYTES:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+def _copy_large(src, dst):
+    # Copy without moving the data through user space where the OS allows it
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(in_fd).st_size
+        offset = 0
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while offset < size:
+                    n = os.copy_file_range(in_fd, out_fd, min(size - offset, KERNEL_COPY_CHUNK))
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+
+        if offset < size and hasattr(os, 'sendfile'):
+            try:
+                while offset < size:
+                    n = os.sendfile(out_fd, in_fd, offset, min(size - offset, KERNEL_COPY_CHUNK))
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+
+        if offset < size:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            shutil.copyfileobj(fsrc, fdst)
+
+
+def _reflink(src, dst):
+    # Copy-on-write clone, raises OSError where the filesystem can't do it
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst)
+    else:
+        raise OSError(f"Reflinks are not supported on {sys.platform}")
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _dest_matches(path, size):
+    try:
+        return os.stat(path).st_size == size
+    except OSError:
+        return False
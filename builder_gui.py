@@ -1,9 +1,16 @@
 import sys
 import os
+import re
+import time
+import queue
 import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, messagebox
+import tkinter.ttk as ttk
 import builder_logic
+import builder_fs
 
 # Try to import CustomTkinter for modern UI
 try:
@@ -11,20 +18,102 @@ try:
     HAS_CTK = True
 except ImportError:
     HAS_CTK = False
-    import tkinter.ttk as ttk
+
+# Template choice meaning the project the builder ships in
+BUILTIN_TEMPLATE = "built-in"
+# Log messages are queued by the worker threads and shown in batches every
+# LOG_TICK_MS, at most LOG_BATCH per tick. Only the last LOG_MAX_LINES are
+# kept on screen, the full log goes to a file under <cache>/logs.
+LOG_TICK_MS = 100
+LOG_BATCH = 1000
+LOG_MAX_LINES = 2000
+LOG_FILES_KEEP = 10
+# Wrap jobs running at the same time, the rest wait in the queue
+JOB_WORKERS = 2
+# Log of the app itself (dependency check, job summaries)
+APP_LOG = 0
+# File counts at the end of copy step names, left out of the log
+STEP_COUNTS = re.compile(r" \(\d+/\d+ files\)$")
+
+
+class WrapJob:
+    """One wrap (or watch) in the job queue, with its own builder."""
+
+    def __init__(self, job_id, args, options, builder, kind="wrap"):
+        self.id = job_id
+        self.args = args  # target, dest, name, app_id, version (target, dest, name to watch)
+        self.options = options
+        self.builder = builder
+        self.kind = kind
+        self.name = args[2]
+        self.dest = args[1]
+        self.status = "queued"
+        self.percent = 0
+        self.step = ""
+        # Steps that got a line in the job's log
+        self.logged_steps = set()
+        self.start = None
+        self.end = None
+        self.future = None
+        self.cancel_requested = False
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def elapsed(self):
+        if self.start is None:
+            return None
+        return (self.end or time.perf_counter()) - self.start
+
 
 class App:
     def __init__(self):
         self.builder = builder_logic.CordovaWrapperBuilder(
-            progress_callback=self.on_progress,
-            log_callback=self.on_log
+            progress_callback=self.on_app_progress,
+            log_callback=self.on_log,
+            log_levels=True
         )
-        self.is_wrapping = False
+        self.deps_ok = False
+        self.jobs = {}
+        self.next_job_id = APP_LOG + 1
+        self.pool = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+        # Watches run until cancelled, so they don't take up wrap workers
+        self.watch_pool = ThreadPoolExecutor()
+        self.was_busy = False
+        self.log_queue = queue.SimpleQueue()
+        self.app_step = ""
+        # Last LOG_MAX_LINES (level, line) per job, APP_LOG for the app itself
+        self.log_lines = {APP_LOG: collections.deque(maxlen=LOG_MAX_LINES)}
+        self.log_view = APP_LOG
+        self.log_shown = 0
+        self.log_file = self.open_log_file()
 
         if HAS_CTK:
             self.setup_ctk()
         else:
             self.setup_tk()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if self.log_file:
+            self.on_log(f"Full log: {self.log_file.name}")
+
+    def open_log_file(self):
+        # New log file per session, dropping the oldest ones
+        log_dir = os.path.join(self.builder.cache_dir, "logs")
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            old = sorted(name for name in os.listdir(log_dir) if name.endswith(".log"))
+            for name in old[:max(0, len(old) - LOG_FILES_KEEP + 1)]:
+                os.remove(os.path.join(log_dir, name))
+            path = os.path.join(log_dir, time.strftime("wrap-%Y%m%d-%H%M%S.log"))
+            return open(path, 'a', encoding='utf-8')
+        except OSError:
+            return None
+
+    def template_names(self):
+        # Templates registered by name (see builder_cli.py template add)
+        names = [name for name in self.builder.templates.names() if not name.startswith("dir-")]
+        return [BUILTIN_TEMPLATE] + names
 
     def setup_ctk(self):
         ctk.set_appearance_mode("System")
@@ -32,7 +121,7 @@ class App:
 
         self.root = ctk.CTk()
         self.root.title("Cordova App Wrapper")
-        self.root.geometry("600x700")
+        self.root.geometry("600x900")
 
         # Main Container
         self.main_frame = ctk.CTkFrame(self.root)
@@ -98,33 +187,112 @@ class App:
         self.entry_ver.insert(0, "1.0.0")
         self.entry_ver.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
 
+        # Link mode
+        self.lbl_link = ctk.CTkLabel(self.frame_settings_grid, text="Site Injection:")
+        self.lbl_link.grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        self.var_link_mode = tk.StringVar(value="copy")
+        self.opt_link = ctk.CTkOptionMenu(self.frame_settings_grid, values=list(builder_fs.LINK_MODES), variable=self.var_link_mode)
+        self.opt_link.grid(row=3, column=1, sticky="w", padx=5, pady=5)
+
+        # Incremental
+        self.var_incremental = tk.BooleanVar(value=False)
+        self.chk_incremental = ctk.CTkCheckBox(self.frame_settings_grid, text="Incremental rebuild (only sync changed files)", variable=self.var_incremental)
+        self.chk_incremental.grid(row=4, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
+        # Minify
+        self.var_optimize = tk.BooleanVar(value=False)
+        self.chk_optimize = ctk.CTkCheckBox(self.frame_settings_grid, text="Minify HTML/CSS/JS", variable=self.var_optimize)
+        self.chk_optimize.grid(row=5, column=0, sticky="w", padx=5, pady=5)
+        self.var_bundle = tk.BooleanVar(value=False)
+        self.chk_bundle = ctk.CTkCheckBox(self.frame_settings_grid, text="Bundle app scripts", variable=self.var_bundle)
+        self.chk_bundle.grid(row=5, column=1, sticky="w", padx=5, pady=5)
+
+        # Images
+        self.var_images = tk.BooleanVar(value=False)
+        self.chk_images = ctk.CTkCheckBox(self.frame_settings_grid, text="Optimize images", variable=self.var_images)
+        self.chk_images.grid(row=6, column=0, sticky="w", padx=5, pady=5)
+        self.var_webp = tk.BooleanVar(value=False)
+        self.chk_webp = ctk.CTkCheckBox(self.frame_settings_grid, text="Convert to WebP", variable=self.var_webp)
+        self.chk_webp.grid(row=6, column=1, sticky="w", padx=5, pady=5)
+
+        # Template
+        self.lbl_template = ctk.CTkLabel(self.frame_settings_grid, text="Template:")
+        self.lbl_template.grid(row=7, column=0, sticky="w", padx=5, pady=5)
+        self.var_template = tk.StringVar(value=BUILTIN_TEMPLATE)
+        self.opt_template = ctk.CTkOptionMenu(self.frame_settings_grid, values=self.template_names(), variable=self.var_template)
+        self.opt_template.grid(row=7, column=1, sticky="w", padx=5, pady=5)
+
+        # Platforms
+        self.lbl_platforms = ctk.CTkLabel(self.frame_settings_grid, text="Platforms:")
+        self.lbl_platforms.grid(row=8, column=0, sticky="w", padx=5, pady=5)
+        self.entry_platforms = ctk.CTkEntry(self.frame_settings_grid, placeholder_text="android, browser, electron")
+        self.entry_platforms.insert(0, "android")
+        self.entry_platforms.grid(row=8, column=1, sticky="ew", padx=5, pady=5)
+
+        # Pre-flight
+        self.var_strict = tk.BooleanVar(value=False)
+        self.chk_strict = ctk.CTkCheckBox(self.frame_settings_grid, text="Stop when the site check finds warnings", variable=self.var_strict)
+        self.chk_strict.grid(row=9, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
+        self.var_dedupe = tk.BooleanVar(value=False)
+        self.chk_dedupe = ctk.CTkCheckBox(self.frame_settings_grid, text="Hardlink duplicate files", variable=self.var_dedupe)
+        self.chk_dedupe.grid(row=10, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
+        self.var_prepare = tk.BooleanVar(value=False)
+        self.chk_prepare = ctk.CTkCheckBox(self.frame_settings_grid, text="Watch: run cordova prepare after each sync", variable=self.var_prepare)
+        self.chk_prepare.grid(row=11, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
         self.frame_settings_grid.columnconfigure(1, weight=1)
 
-        # Wrap Button
+        # Wrap Button (adds a job to the queue)
         self.btn_wrap = ctk.CTkButton(self.main_frame, text="Wrap App", height=40, font=ctk.CTkFont(size=16, weight="bold"), command=self.start_wrap)
-        self.btn_wrap.pack(fill="x", pady=20)
-
-        # Progress
+        self.btn_wrap.pack(fill="x", pady=(20, 5))
+        self.btn_watch = ctk.CTkButton(self.main_frame, text="Watch Site", command=self.start_watch)
+        self.btn_watch.pack(fill="x", pady=(0, 10))
+
+        # Jobs
+        self.tree_jobs = self.create_job_list(self.main_frame)
+        self.frame_job_buttons = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        self.frame_job_buttons.pack(fill="x", pady=5)
+        self.btn_cancel = ctk.CTkButton(self.frame_job_buttons, text="Cancel Job", fg_color="firebrick", width=100, command=self.cancel_job)
+        self.btn_cancel.pack(side="left", padx=(0, 5))
+        self.btn_clear = ctk.CTkButton(self.frame_job_buttons, text="Clear Finished", width=100, command=self.clear_finished)
+        self.btn_clear.pack(side="left", padx=5)
+        self.btn_profile = ctk.CTkButton(self.frame_job_buttons, text="Save Build Profile", width=120, command=self.save_profile)
+        self.btn_profile.pack(side="right", padx=(5, 0))
+        self.btn_open = ctk.CTkButton(self.frame_job_buttons, text="Open Folder", fg_color="green", width=100, command=self.open_output_folder)
+        self.btn_open.pack(side="right", padx=5)
+        self.btn_export = ctk.CTkButton(self.frame_job_buttons, text="Export...", width=100, command=self.export_project)
+        self.btn_export.pack(side="right", padx=5)
+
+        # Progress of the selected job
         self.progress = ctk.CTkProgressBar(self.main_frame)
-        self.progress.pack(fill="x", pady=(0, 10))
+        self.progress.pack(fill="x", pady=(5, 10))
         self.progress.set(0)
 
         # Log
+        self.frame_log = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        self.frame_log.pack(fill="x")
+        self.lbl_log_level = ctk.CTkLabel(self.frame_log, text="Show:")
+        self.lbl_log_level.pack(side="left", padx=(0, 5))
+        self.var_log_level = tk.StringVar(value="debug")
+        self.opt_log_level = ctk.CTkOptionMenu(self.frame_log, values=list(builder_logic.LOG_LEVELS), variable=self.var_log_level, width=100)
+        self.opt_log_level.pack(side="left")
+        self.var_log_level.trace_add("write", lambda *args: self.refilter_log())
+
         self.txt_log = ctk.CTkTextbox(self.main_frame, height=150)
-        self.txt_log.pack(fill="both", expand=True)
+        self.txt_log.pack(fill="both", expand=True, pady=(5, 0))
         self.txt_log.configure(state="disabled")
 
-        # Open Folder Button (Hidden initially)
-        self.btn_open = ctk.CTkButton(self.main_frame, text="Open Folder", fg_color="green", command=self.open_output_folder)
-
         # Start dependency check
         self.root.after(100, self.start_dep_check)
+        self.root.after(LOG_TICK_MS, self.drain_log)
 
     def setup_tk(self):
         # Fallback to standard tkinter
         self.root = tk.Tk()
         self.root.title("Cordova App Wrapper (Standard Mode)")
-        self.root.geometry("600x700")
+        self.root.geometry("600x900")
 
         style = ttk.Style()
         style.theme_use('clam')
@@ -165,28 +333,99 @@ class App:
         self.entry_ver.insert(0, "1.0.0")
         self.entry_ver.grid(row=2, column=1, sticky="ew", pady=2)
 
+        ttk.Label(frame_settings, text="Site Injection:").grid(row=3, column=0, sticky="w", pady=2)
+        self.var_link_mode = tk.StringVar(value="copy")
+        ttk.Combobox(frame_settings, textvariable=self.var_link_mode, values=builder_fs.LINK_MODES, state="readonly").grid(row=3, column=1, sticky="w", pady=2)
+
+        self.var_incremental = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Incremental rebuild (only sync changed files)", variable=self.var_incremental).grid(row=4, column=0, columnspan=2, sticky="w", pady=2)
+
+        self.var_optimize = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Minify HTML/CSS/JS", variable=self.var_optimize).grid(row=5, column=0, sticky="w", pady=2)
+        self.var_bundle = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Bundle app scripts", variable=self.var_bundle).grid(row=5, column=1, sticky="w", pady=2)
+
+        self.var_images = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Optimize images", variable=self.var_images).grid(row=6, column=0, sticky="w", pady=2)
+        self.var_webp = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Convert to WebP", variable=self.var_webp).grid(row=6, column=1, sticky="w", pady=2)
+
+        ttk.Label(frame_settings, text="Template:").grid(row=7, column=0, sticky="w", pady=2)
+        self.var_template = tk.StringVar(value=BUILTIN_TEMPLATE)
+        ttk.Combobox(frame_settings, textvariable=self.var_template, values=self.template_names(), state="readonly").grid(row=7, column=1, sticky="w", pady=2)
+
+        ttk.Label(frame_settings, text="Platforms:").grid(row=8, column=0, sticky="w", pady=2)
+        self.entry_platforms = ttk.Entry(frame_settings)
+        self.entry_platforms.insert(0, "android")
+        self.entry_platforms.grid(row=8, column=1, sticky="ew", pady=2)
+
+        self.var_strict = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Stop when the site check finds warnings", variable=self.var_strict).grid(row=9, column=0, columnspan=2, sticky="w", pady=2)
+        self.var_dedupe = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Hardlink duplicate files", variable=self.var_dedupe).grid(row=10, column=0, columnspan=2, sticky="w", pady=2)
+        self.var_prepare = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_settings, text="Watch: run cordova prepare after each sync", variable=self.var_prepare).grid(row=11, column=0, columnspan=2, sticky="w", pady=2)
+
         frame_settings.columnconfigure(1, weight=1)
 
-        # Wrap
+        # Wrap (adds a job to the queue)
         self.btn_wrap = ttk.Button(self.main_frame, text="Wrap App", command=self.start_wrap)
-        self.btn_wrap.pack(fill="x", pady=20)
-
-        # Progress
+        self.btn_wrap.pack(fill="x", pady=(20, 5))
+        ttk.Button(self.main_frame, text="Watch Site", command=self.start_watch).pack(fill="x", pady=(0, 10))
+
+        # Jobs
+        self.tree_jobs = self.create_job_list(self.main_frame)
+        frame_job_buttons = ttk.Frame(self.main_frame)
+        frame_job_buttons.pack(fill="x", pady=5)
+        ttk.Button(frame_job_buttons, text="Cancel Job", command=self.cancel_job).pack(side="left", padx=(0, 5))
+        ttk.Button(frame_job_buttons, text="Clear Finished", command=self.clear_finished).pack(side="left", padx=5)
+        ttk.Button(frame_job_buttons, text="Save Build Profile", command=self.save_profile).pack(side="right", padx=(5, 0))
+        ttk.Button(frame_job_buttons, text="Open Folder", command=self.open_output_folder).pack(side="right", padx=5)
+        ttk.Button(frame_job_buttons, text="Export...", command=self.export_project).pack(side="right", padx=5)
+
+        # Progress of the selected job
         self.progress = ttk.Progressbar(self.main_frame, orient="horizontal", mode="determinate")
-        self.progress.pack(fill="x", pady=(0, 10))
+        self.progress.pack(fill="x", pady=(5, 10))
 
         # Log
+        frame_log = ttk.Frame(self.main_frame)
+        frame_log.pack(fill="x")
+        ttk.Label(frame_log, text="Show:").pack(side="left", padx=(0, 5))
+        self.var_log_level = tk.StringVar(value="debug")
+        ttk.Combobox(frame_log, textvariable=self.var_log_level, values=builder_logic.LOG_LEVELS, state="readonly", width=10).pack(side="left")
+        self.var_log_level.trace_add("write", lambda *args: self.refilter_log())
+
         self.txt_log = tk.Text(self.main_frame, height=10)
-        self.txt_log.pack(fill="both", expand=True)
+        self.txt_log.pack(fill="both", expand=True, pady=(5, 0))
         self.txt_log.config(state="disabled")
 
-        self.btn_open = ttk.Button(self.main_frame, text="Open Folder", command=self.open_output_folder)
-
         self.root.after(100, self.start_dep_check)
+        self.root.after(LOG_TICK_MS, self.drain_log)
+
+    def create_job_list(self, parent):
+        # ttk.Treeview in both modes, CustomTkinter has no table widget
+        tree = ttk.Treeview(parent, columns=("name", "status", "progress", "time"), show="headings", height=5, selectmode="browse")
+        for column, title, width in (("name", "App", 140), ("status", "Status", 80), ("progress", "Progress", 220), ("time", "Time", 60)):
+            tree.heading(column, text=title)
+            tree.column(column, width=width, stretch=column in ("name", "progress"))
+        tree.pack(fill="x")
+        tree.bind("<<TreeviewSelect>>", lambda event: self.select_job())
+        return tree
 
     def run(self):
         self.root.mainloop()
 
+    def on_close(self):
+        # Stop running jobs and drop queued ones before closing
+        for job in self.jobs.values():
+            if job.active:
+                job.cancel_requested = True
+                job.future.cancel()
+                job.builder.cancel()
+        self.pool.shutdown(wait=False)
+        self.watch_pool.shutdown(wait=False)
+        self.root.destroy()
+
     def browse_target(self):
         path = filedialog.askdirectory(title="Select Website Folder")
         if path:
@@ -219,32 +458,127 @@ class App:
         safe_name = "".join(c.lower() for c in folder_name if c.isalnum())
         self.update_entry(self.entry_id, f"com.example.{safe_name}")
 
-    def on_log(self, message):
-        self.root.after(0, self._append_log, message)
-
-    def _append_log(self, message):
+    def on_log(self, message, level=None, job_id=APP_LOG):
+        # Called from any thread, shown by drain_log
+        self.log_queue.put((job_id, level or builder_logic.message_level(message), message))
+
+    def on_progress(self, job, percent, step_name):
+        # The job list shows the latest progress, the log only gets a line
+        # when a step starts (parallel stages report in turns)
+        job.percent = percent
+        job.step = step_name
+        step = STEP_COUNTS.sub("", step_name)
+        if step not in job.logged_steps:
+            job.logged_steps.add(step)
+            self.log_queue.put((job.id, "info", f"[{percent}%] {step}"))
+
+    def on_app_progress(self, percent, step_name):
+        # Progress of the app's own builder (the dependency check), one
+        # line per step
+        step = STEP_COUNTS.sub("", step_name)
+        if step != self.app_step:
+            self.app_step = step
+            self.log_queue.put((APP_LOG, "info", f"[{percent}%] {step}"))
+
+    def log_visible(self, level):
+        levels = builder_logic.LOG_LEVELS
+        return levels.index(level) >= levels.index(self.var_log_level.get())
+
+    def drain_log(self):
+        self.root.after(LOG_TICK_MS, self.drain_log)
+        batch = []
+        try:
+            while len(batch) < LOG_BATCH:
+                job_id, level, message = self.log_queue.get_nowait()
+                batch.extend((job_id, level, line) for line in message.splitlines() or [""])
+        except queue.Empty:
+            pass
+
+        if batch:
+            if self.log_file:
+                self.log_file.write("".join(f"{level.upper():7} {self.job_prefix(job_id)}{line}\n"
+                                            for job_id, level, line in batch))
+                self.log_file.flush()
+            for job_id, level, line in batch:
+                if job_id in self.log_lines:
+                    self.log_lines[job_id].append((level, line))
+            self._show_log([line for job_id, level, line in batch
+                            if job_id == self.log_view and self.log_visible(level)])
+
+        self.update_jobs()
+
+    def job_prefix(self, job_id):
+        job = self.jobs.get(job_id)
+        return f"[{job.id}:{job.name}] " if job else ""
+
+    def _show_log(self, lines, clear=False):
+        # One insert per batch, trimming the oldest lines past LOG_MAX_LINES
+        if not lines and not clear:
+            return
+        lines = lines[-LOG_MAX_LINES:]
+        self._set_log_state("normal")
+        if clear:
+            self.txt_log.delete("1.0", "end")
+            self.log_shown = 0
+        if lines:
+            self.txt_log.insert("end", "\n".join(lines) + "\n")
+            self.log_shown += len(lines)
+        excess = self.log_shown - LOG_MAX_LINES
+        if excess > 0:
+            self.txt_log.delete("1.0", f"{excess + 1}.0")
+            self.log_shown -= excess
+        self.txt_log.see("end")
+        self._set_log_state("disabled")
+
+    def _set_log_state(self, state):
         if HAS_CTK:
-            self.txt_log.configure(state="normal")
-            self.txt_log.insert("end", message + "\n")
-            self.txt_log.see("end")
-            self.txt_log.configure(state="disabled")
+            self.txt_log.configure(state=state)
         else:
-            self.txt_log.config(state="normal")
-            self.txt_log.insert("end", message + "\n")
-            self.txt_log.see("end")
-            self.txt_log.config(state="disabled")
-
-    def on_progress(self, percent, step_name):
-        self.root.after(0, self._update_progress_ui, percent, step_name)
-
-    def _update_progress_ui(self, percent, step_name):
-        val = percent / 100.0
+            self.txt_log.config(state=state)
+
+    def refilter_log(self):
+        # Redraw the kept lines of the shown job for the chosen level
+        lines = self.log_lines.get(self.log_view, ())
+        self._show_log([line for level, line in lines if self.log_visible(level)], clear=True)
+
+    def selected_job(self):
+        selection = self.tree_jobs.selection()
+        return self.jobs.get(int(selection[0])) if selection else None
+
+    def select_job(self):
+        # Show the selected job's log and progress, or the app log
+        job = self.selected_job()
+        self.log_view = job.id if job else APP_LOG
+        self.refilter_log()
+        self.update_jobs()
+
+    def update_jobs(self):
+        # Refresh the job list and the progress bar, called every tick
+        for job in self.jobs.values():
+            elapsed = job.elapsed()
+            status = "cancelling" if job.status == "running" and job.cancel_requested else job.status
+            values = (job.name, status, f"{job.percent}% {job.step}" if job.status == "running" else f"{job.percent}%",
+                      "" if elapsed is None else f"{int(elapsed) // 60}:{int(elapsed) % 60:02d}")
+            if self.tree_jobs.item(str(job.id), "values") != values:
+                self.tree_jobs.item(str(job.id), values=values)
+
+        job = self.jobs.get(self.log_view)
+        percent = job.percent if job else 0
         if HAS_CTK:
-            self.progress.set(val)
+            self.progress.set(percent / 100.0)
         else:
             self.progress['value'] = percent
 
-        self._append_log(f"[{percent}%] {step_name}")
+        # Summary once the queue has run empty
+        busy = any(job.active for job in self.jobs.values())
+        if self.was_busy and not busy:
+            done = [job for job in self.jobs.values() if job.kind == "wrap" and job.status in ("done", "failed")]
+            failed = sum(1 for job in done if job.status == "failed")
+            if failed:
+                messagebox.showerror("Error", f"{failed} of {len(done)} jobs failed. Select a job to see its log.")
+            elif done:
+                messagebox.showinfo("Success", f"{len(done)} project(s) wrapped successfully!")
+        self.was_busy = busy
 
     def start_dep_check(self):
         threading.Thread(target=self._check_deps_thread, daemon=True).start()
@@ -252,6 +586,7 @@ class App:
     def _check_deps_thread(self):
         self.on_log("Checking dependencies...")
         success = self.builder.check_dependencies()
+        self.deps_ok = success
         if not success:
             self.on_log("CRITICAL: Missing dependencies. Check log above.")
             messagebox.showerror("Error", "Missing dependencies. Please see log.")
@@ -259,8 +594,6 @@ class App:
             self.on_log("Ready to wrap.")
 
     def start_wrap(self):
-        if self.is_wrapping: return
-
         target = self.entry_target.get()
         dest = self.entry_dest.get()
         name = self.entry_name.get()
@@ -275,42 +608,180 @@ class App:
             messagebox.showerror("Error", "Source folder does not exist.")
             return
 
-        if os.path.exists(dest):
+        if any(job.active and os.path.abspath(job.dest) == os.path.abspath(dest) for job in self.jobs.values()):
+            messagebox.showwarning("Already Queued", f"A job for '{dest}' is already queued or running.")
+            return
+
+        incremental = self.var_incremental.get()
+        options = {
+            "overwrite": True,
+            "incremental": incremental,
+            "link_mode": self.var_link_mode.get(),
+            "optimize": self.var_optimize.get(),
+            "optimize_images": self.var_images.get(),
+            "bundle_js": self.var_bundle.get(),
+            "template": None if self.var_template.get() == BUILTIN_TEMPLATE else self.var_template.get(),
+            "platforms": builder_logic.parse_platforms(self.entry_platforms.get()),
+            "strict_preflight": self.var_strict.get(),
+            "dedupe": self.var_dedupe.get(),
+            # The toolchain was checked at startup
+            "check_deps": not self.deps_ok,
+        }
+        is_wrapped = os.path.exists(os.path.join(dest, builder_fs.MANIFEST_NAME))
+
+        if os.path.exists(dest) and not (incremental and is_wrapped):
             confirm = messagebox.askyesno("Confirm Overwrite", f"The folder '{dest}' already exists.\nDo you want to delete it and replace it?")
             if not confirm:
                 return
 
-        self.is_wrapping = True
-        self.btn_wrap.configure(state="disabled") if HAS_CTK else self.btn_wrap.config(state="disabled")
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        builder = builder_logic.CordovaWrapperBuilder(
+            log_callback=lambda message, level: self.on_log(message, level, job_id),
+            log_levels=True,
+            cache_dir=self.builder.cache_dir,
+            image_webp=self.var_webp.get()
+        )
+        job = WrapJob(job_id, (target, dest, name, app_id, ver), options, builder)
+        builder.progress_cb = lambda percent, step_name: self.on_progress(job, percent, step_name)
+        self.jobs[job_id] = job
+        self.log_lines[job_id] = collections.deque(maxlen=LOG_MAX_LINES)
+        self.tree_jobs.insert("", "end", iid=str(job_id), values=(name, job.status, "", ""))
+        self.on_log(f"Queued job {job_id}: {name} -> {dest}")
+        job.future = self.pool.submit(self._run_job, job)
+
+    def start_watch(self):
+        target = self.entry_target.get()
+        dest = self.entry_dest.get()
 
-        threading.Thread(target=self._wrap_thread, args=(target, dest, name, app_id, ver, True), daemon=True).start()
+        if not target or not dest:
+            messagebox.showwarning("Missing Input", "Please select the website folder and the output folder.")
+            return
 
-    def _wrap_thread(self, target, dest, name, app_id, ver, overwrite):
-        success = self.builder.wrap_project(target, dest, name, app_id, ver, overwrite=overwrite)
-        self.is_wrapping = False
+        if not os.path.exists(target):
+            messagebox.showerror("Error", "Source folder does not exist.")
+            return
 
-        self.root.after(0, self._wrap_finished, success, dest)
+        if not os.path.isfile(os.path.join(dest, "config.xml")):
+            messagebox.showwarning("Not Wrapped", f"'{dest}' is not a wrapped project yet. Wrap the site first.")
+            return
 
-    def _wrap_finished(self, success, dest):
-        if HAS_CTK:
-            self.btn_wrap.configure(state="normal")
-        else:
-            self.btn_wrap.config(state="normal")
+        if any(job.active and os.path.abspath(job.dest) == os.path.abspath(dest) for job in self.jobs.values()):
+            messagebox.showwarning("Already Queued", f"A job for '{dest}' is already queued or running.")
+            return
 
-        if success:
-            messagebox.showinfo("Success", "Project wrapped successfully!")
-            if HAS_CTK:
-                self.btn_open.pack(pady=10)
+        options = {
+            "link_mode": self.var_link_mode.get(),
+            "prepare": self.var_prepare.get(),
+        }
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        builder = builder_logic.CordovaWrapperBuilder(
+            log_callback=lambda message, level: self.on_log(message, level, job_id),
+            log_levels=True,
+            cache_dir=self.builder.cache_dir
+        )
+        name = f"Watch {os.path.basename(os.path.normpath(target))}"
+        job = WrapJob(job_id, (target, dest, name), options, builder, kind="watch")
+        builder.progress_cb = lambda percent, step_name: self.on_progress(job, percent, step_name)
+        self.jobs[job_id] = job
+        self.log_lines[job_id] = collections.deque(maxlen=LOG_MAX_LINES)
+        self.tree_jobs.insert("", "end", iid=str(job_id), values=(name, job.status, "", ""))
+        self.on_log(f"Watching {target} -> {dest} (job {job_id}), cancel the job to stop.")
+        job.future = self.watch_pool.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        # Runs on a pool thread
+        if job.cancel_requested:
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        job.start = time.perf_counter()
+        try:
+            if job.kind == "watch":
+                success = job.builder.watch_project(*job.args[:2], **job.options)
             else:
-                self.btn_open.pack(pady=10)
-            self.final_dest = dest
+                success = job.builder.wrap_project(*job.args, **job.options)
+        except Exception as e:
+            job.builder.log(f"Exception: {e}")
+            success = False
+        job.end = time.perf_counter()
+        if job.builder.aborted or job.cancel_requested:
+            job.status = "cancelled"
         else:
-            messagebox.showerror("Error", "Wrapping failed. See log for details.")
+            job.status = "done" if success else "failed"
+            if success:
+                job.percent = 100
+        self.on_log(f"Job {job.id} ({job.name}) {job.status} in {job.end - job.start:.1f}s",
+                    "info" if job.status == "done" else "warning")
+
+    def cancel_job(self):
+        job = self.selected_job()
+        if not job or not job.active or job.cancel_requested:
+            return
+        self.on_log(f"Cancelling job {job.id} ({job.name})...")
+        job.cancel_requested = True
+        if job.future.cancel():
+            job.status = "cancelled"
+        else:
+            # Stopping the running command may take a few seconds
+            threading.Thread(target=job.builder.cancel, daemon=True).start()
+
+    def clear_finished(self):
+        for job in [job for job in self.jobs.values() if not job.active]:
+            del self.jobs[job.id]
+            del self.log_lines[job.id]
+            self.tree_jobs.delete(str(job.id))
+        if self.log_view not in self.jobs:
+            self.log_view = APP_LOG
+            self.refilter_log()
+
+    def finished_job(self):
+        # Selected job if it succeeded, otherwise the last one that did
+        job = self.selected_job()
+        if job and job.status == "done":
+            return job
+        done = [job for job in self.jobs.values() if job.status == "done"]
+        if not done:
+            messagebox.showinfo("No Project", "No wrap job has finished successfully yet.")
+            return None
+        return done[-1]
+
+    def save_profile(self):
+        job = self.finished_job()
+        if not job: return
+        path = filedialog.asksaveasfilename(
+            title="Save Build Profile",
+            defaultextension=".json",
+            filetypes=[("Build profile", "*.json"), ("Chrome trace", "*.trace.json")]
+        )
+        if not path: return
+        fmt = "trace" if path.endswith(".trace.json") else "json"
+        try:
+            job.builder.export_profile(path, fmt=fmt)
+            self.on_log(f"Build profile saved to {path}")
+        except Exception as e:
+            self.on_log(f"Could not save build profile: {e}")
+
+    def export_project(self):
+        job = self.finished_job()
+        if not job: return
+        path = filedialog.asksaveasfilename(
+            title="Export Project",
+            initialfile=os.path.basename(os.path.normpath(job.dest)) + ".zip",
+            defaultextension=".zip",
+            filetypes=[("Zip archive", "*.zip"), ("Gzipped tar archive", "*.tar.gz"), ("Tar archive", "*.tar")]
+        )
+        if not path: return
+        self.on_log(f"Exporting job {job.id} ({job.name}) to {path}...")
+        # Runs on the job pool, the builder logs into the job's log
+        self.pool.submit(job.builder.export_project, job.dest, path)
 
     def open_output_folder(self):
-        if not hasattr(self, 'final_dest'): return
+        job = self.finished_job()
+        if not job: return
 
-        path = self.final_dest
+        path = job.dest
         try:
             if sys.platform == 'win32':
                 os.startfile(path)
@@ -2,88 +2,617 @@ import os
 import shutil
 import subprocess
 import json
+import hashlib
 import xml.etree.ElementTree as ET
 import re
 import sys
+import signal
+import platform
+import tempfile
 import threading
+import time
+import builder_bundle
+import builder_export
+import builder_fs
+import builder_optimize
+import builder_preflight
+import builder_profile
+import builder_templates
+import builder_watch
+from builder_stages import Stage, StageGraph
+from concurrent.futures import ThreadPoolExecutor
+
+# Log levels, least severe first. Command output is logged as "debug".
+LOG_LEVELS = ("debug", "info", "warning", "error")
+ERROR_PREFIXES = ("Error", "Exception", "CRITICAL", "Failed", "Could not", "Not completed", "NPM is not")
+WARNING_PREFIXES = ("Warning", "npm ci failed", "Cordova not found")
+
+
+def parse_platforms(text):
+    # "android, browser" (or a list) -> ["android", "browser"]
+    if isinstance(text, (list, tuple)):
+        return [str(spec).strip() for spec in text if str(spec).strip()]
+    return [spec for spec in re.split(r'[\s,]+', text or "") if spec]
+
+
+def message_level(message):
+    # Level of a builder message that was logged without one
+    if message.startswith(ERROR_PREFIXES):
+        return "error"
+    if message.startswith(WARNING_PREFIXES):
+        return "warning"
+    return "info"
+
 
 class CordovaWrapperBuilder:
-    def __init__(self, progress_callback=None, log_callback=None):
+    # Template files rewritten by configure_project
+    PATCHED_FILES = ("config.xml", "package.json", "www/js/index.js")
+    # Template files written to during the build, never linked to the template
+    WRITABLE_FILES = PATCHED_FILES + ("package-lock.json", "www/index.html")
+    # Default template: the project this builder ships in
+    TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+    # Project folders generated by npm and cordova
+    DERIVED_DIRS = ("node_modules", "platforms", "plugins")
+    # Platforms added when none are given
+    DEFAULT_PLATFORMS = ("android",)
+    # name or name@version, as `cordova platform add` takes them
+    PLATFORM_RE = re.compile(r'^[a-z][a-z0-9-]*(@[\w.^~<>=*-]+)?$')
+    # Working copies used to add several platforms at once, inside the project
+    PLATFORM_WORK_DIR = ".platform-work"
+    # Lines of www/js/index.js that patch_index_js replaces
+    LANDING_URL_PATTERN = r'var\s+LANDING_URL\s*=\s*".*?";'
+    SPLIT_URL_RE_PATTERN = r'var\s+SPLIT_URL_RE\s*=.*;'
+    # Pre-flight warnings logged one by one, the rest are counted
+    PREFLIGHT_LOG_LIMIT = 20
+    # Duplicate groups listed in the log
+    DEDUPE_LOG_GROUPS = 10
+    # Command line tools the builder depends on
+    TOOLS = ("node", "npm", "cordova")
+    # Number of toolchains remembered in the on-disk cache
+    TOOLCHAIN_CACHE_SIZE = 8
+    # Default per-command timeouts in seconds (None waits forever)
+    DEFAULT_TIMEOUTS = {
+        "version": 60,
+        "npm install": 30 * 60,
+        "platform add": 20 * 60,
+        "prepare": 10 * 60,
+    }
+    # Seconds between SIGTERM and SIGKILL when stopping a command
+    KILL_GRACE_PERIOD = 5
+    # package.json fields that decide what ends up in node_modules
+    NPM_DEPENDENCY_FIELDS = ("dependencies", "devDependencies", "optionalDependencies",
+                             "peerDependencies", "overrides")
+    # Number of node_modules trees kept in the npm store
+    NPM_STORE_SIZE = 5
+
+    def __init__(self, progress_callback=None, log_callback=None, copy_workers=None, copy_engine=None,
+                 cache_dir=None, timeouts=None, use_npm_store=True, npm_link_mode="hardlink", offline=False,
+                 stage_workers=4, image_max_size=None, image_webp=False, image_quality=80,
+                 template_link_mode="reflink", log_levels=False):
         self.progress_cb = progress_callback
         self.log_cb = log_callback
+        # With log_levels the callback is called as log_callback(message, level)
+        self.log_levels = log_levels
+        self.copy_engine = copy_engine or builder_fs.CopyEngine(workers=copy_workers)
+        self.cache_dir = cache_dir or builder_fs.default_cache_dir()
+        self.templates = builder_templates.TemplateRegistry(self.cache_dir, self.copy_engine)
+        self.template_link_mode = template_link_mode
+        self.use_npm_store = use_npm_store
+        self.npm_link_mode = npm_link_mode
+        self.offline = offline
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS, **(timeouts or {}))
         self.aborted = False
+        self.progress_percent = 0
+        self.stage_workers = stage_workers
+        self.image_max_size = image_max_size
+        self.image_webp = image_webp
+        self.image_quality = image_quality
+        self.stage_timings = []
+        self.site_changed = None
+        self.profile = builder_profile.BuildProfile()
+        self._processes = set()
+        self._process_lock = threading.Lock()
+        self.toolchain = None
+        self.tool_versions = {}
+        # {dest_dir: (manifest file stat, FileManifest)} shared between wraps
+        # by a long-running process, so a rebuild skips reading the manifest
+        self.manifests = None
+        # {platform: {"status", "duration"}} of the last wrap
+        self.platform_results = {}
+        # builder_preflight.scan_site report of the last wrap
+        self.preflight_report = None
+        # {"groups": [{"size", "paths"}], "files", "wasted", "linked"} of the
+        # last wrap with dedupe
+        self.dedupe_report = None
+        self._platform_lock = threading.Lock()
 
-    def log(self, message):
-        if self.log_cb:
+    def log(self, message, level=None):
+        if self.log_cb and self.log_levels:
+            self.log_cb(message, level or message_level(message))
+        elif self.log_cb:
             self.log_cb(message)
         else:
             print(f"[LOG] {message}")
 
     def update_progress(self, percent, step_name):
+        self.progress_percent = percent
         if self.progress_cb:
             self.progress_cb(percent, step_name)
 
-    def run_command(self, cmd, cwd=None, shell=False):
+    def stage_progress(self, graph, stage_name, step_name):
+        # Per-file copy progress of one stage, forwarded on whole-percent
+        # changes of that stage
+        stage = next(s for s in graph.stages if s.name == stage_name)
+        last = [0]
+        lock = threading.Lock()
+
+        def callback(done, total):
+            if self.aborted:
+                raise builder_fs.Cancelled()
+            percent = 100 * done // total
+            with lock:
+                if percent <= last[0] and done != total:
+                    return
+                last[0] = percent
+            graph.report(stage, done / total, f"{step_name} ({done}/{total} files)")
+        return callback
+
+    def run_command(self, cmd, cwd=None, shell=False, timeout=None):
+        # Output is streamed to the log line by line while the command runs.
+        # Returns False on failure, timeout (seconds) or cancel.
         self.log(f"Running command: {' '.join(cmd) if isinstance(cmd, list) else cmd}")
+        if self.aborted:
+            self.log("Cancelled, not starting command.")
+            return False
         try:
             # shell=True required for some npm commands on windows, but generally avoid if possible
             if sys.platform == 'win32':
                 shell = True
 
-            result = subprocess.run(
+            # Own process group, so a cancel or timeout also stops whatever
+            # npm / cordova spawned
+            if sys.platform == 'win32':
+                group_kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+            else:
+                group_kwargs = {"start_new_session": True}
+
+            proc = subprocess.Popen(
                 cmd,
                 cwd=cwd,
                 shell=shell,
-                check=True,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                errors='replace',
+                bufsize=1,
+                **group_kwargs
             )
-            self.log(result.stdout)
-            return True
-        except subprocess.CalledProcessError as e:
-            self.log(f"Error running command: {e}")
-            self.log(e.stderr)
-            return False
         except Exception as e:
             self.log(f"Exception: {e}")
             return False
 
+        with self._process_lock:
+            self._processes.add(proc)
+            # cancel() sets aborted before it takes the lock, so a cancel
+            # between the check above and here is seen now
+            cancelled = self.aborted
+        if cancelled:
+            self.kill_process(proc)
+        started = time.perf_counter()
+        cpu_before = builder_profile.children_cpu_time()
+        reader = threading.Thread(target=self._pump_output, args=(proc,), daemon=True)
+        reader.start()
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.log(f"Error: command did not finish within {timeout} seconds. Stopping it...")
+            self.kill_process(proc)
+            returncode = None
+        finally:
+            with self._process_lock:
+                self._processes.discard(proc)
+        # Descendants that escaped the process group may keep the pipe open
+        reader.join(timeout=5)
+        # Child CPU time is process wide, so it is approximate while other
+        # commands run concurrently
+        self.profile.record_command(
+            ' '.join(cmd) if isinstance(cmd, list) else cmd, started, time.perf_counter(),
+            max(0.0, builder_profile.children_cpu_time() - cpu_before), returncode
+        )
+
+        if self.aborted:
+            self.log("Command cancelled.")
+            return False
+        if returncode is None:
+            return False
+        if returncode != 0:
+            self.log(f"Error running command: exit status {returncode}")
+            return False
+        return True
+
+    def _pump_output(self, proc):
+        for line in proc.stdout:
+            line = line.rstrip()
+            if line:
+                self.log(line, "debug")
+        proc.stdout.close()
+
+    def kill_process(self, proc):
+        try:
+            if sys.platform == 'win32':
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                os.killpg(proc.pid, signal.SIGTERM)
+                try:
+                    proc.wait(timeout=self.KILL_GRACE_PERIOD)
+                    return
+                except subprocess.TimeoutExpired:
+                    os.killpg(proc.pid, signal.SIGKILL)
+        except (OSError, ProcessLookupError):
+            pass
+        try:
+            proc.wait(timeout=self.KILL_GRACE_PERIOD)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def cancel(self):
+        # Safe to call from another thread (e.g. the GUI)
+        self.aborted = True
+        with self._process_lock:
+            running = list(self._processes)
+        for proc in running:
+            self.kill_process(proc)
+
+    def check_cancelled(self):
+        if self.aborted:
+            self.log("Wrap cancelled.")
+        return self.aborted
+
+    def resolve_toolchain(self):
+        # Locate node/npm/cordova on PATH. The key changes whenever PATH or any
+        # of the executables changes, which invalidates the cached versions.
+        if self.toolchain is not None:
+            return self.toolchain
+
+        paths = {tool: shutil.which(tool) for tool in self.TOOLS}
+        h = hashlib.sha256(os.environ.get("PATH", "").encode())
+        for tool in self.TOOLS:
+            h.update(f"\0{tool}={paths[tool]}".encode())
+            if paths[tool]:
+                try:
+                    st = os.stat(paths[tool])
+                    h.update(f":{st.st_mtime_ns}:{st.st_size}".encode())
+                except OSError:
+                    pass
+        key = h.hexdigest()
+
+        cache = builder_fs.read_json(self.toolchain_cache_path(), {})
+        versions = cache.get(key, {}) if isinstance(cache, dict) else {}
+        self.toolchain = {"key": key, "paths": paths}
+        self.tool_versions = {tool: versions[tool] for tool in self.TOOLS if versions.get(tool)}
+        return self.toolchain
+
+    def toolchain_cache_path(self):
+        return os.path.join(self.cache_dir, "toolchain.json")
+
+    def save_toolchain_cache(self):
+        path = self.toolchain_cache_path()
+        cache = builder_fs.read_json(path, {})
+        if not isinstance(cache, dict):
+            cache = {}
+        key = self.toolchain["key"]
+        cache.pop(key, None)
+        cache[key] = dict(self.tool_versions)
+        # Only keep the most recent toolchains
+        for old_key in list(cache)[:-self.TOOLCHAIN_CACHE_SIZE]:
+            del cache[old_key]
+        try:
+            builder_fs.write_json(path, cache, indent=2)
+        except Exception as e:
+            self.log(f"Warning: Could not save toolchain cache: {e}")
+
+    def probe_version(self, tool):
+        # Returns the version string printed by `<tool> --version`, or None.
+        # Results are kept per toolchain in memory and on disk.
+        toolchain = self.resolve_toolchain()
+        if tool in self.tool_versions:
+            return self.tool_versions[tool]
+        try:
+            result = subprocess.run(
+                [toolchain["paths"].get(tool) or tool, "--version"],
+                shell=sys.platform == 'win32',
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=self.timeouts.get("version")
+            )
+        except Exception:
+            return None
+        lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        version = lines[-1] if lines else ""
+        self.tool_versions[tool] = version
+        self.save_toolchain_cache()
+        return version
+
     def check_dependencies(self):
-        self.update_progress(0, "Checking dependencies...")
+        self.update_progress(self.progress_percent, "Checking dependencies...")
+
+        # When everything resolves on PATH there is no need to start the
+        # tools, versions are probed lazily (and cached) when needed
+        toolchain = self.resolve_toolchain()
+        if all(toolchain["paths"].values()):
+            for tool, label in (("node", "Node.js"), ("npm", "NPM"), ("cordova", "Cordova")):
+                version = self.tool_versions.get(tool)
+                self.log(f"{label} {version + ' ' if version else ''}found at {toolchain['paths'][tool]}")
+            self.log("Dependencies check passed.")
+            return True
 
         # Check Node
-        if not self.run_command(["node", "--version"]):
-            self.log("Node.js is not installed. Please install Node.js.")
+        version = self.probe_version("node")
+        if version is None:
+            self.log("Node.js is not installed. Please install Node.js.", "error")
             return False
+        self.log(f"Node.js {version}")
 
         # Check NPM
-        if not self.run_command(["npm", "--version"]):
+        version = self.probe_version("npm")
+        if version is None:
             self.log("NPM is not installed.")
             return False
+        self.log(f"NPM {version}")
 
         # Check Cordova
-        if not self.run_command(["cordova", "--version"]):
+        version = self.probe_version("cordova")
+        if version is None:
             self.log("Cordova not found. Attempting to install globally...")
-            if not self.run_command(["npm", "install", "-g", "cordova"]):
+            if not self.run_command(["npm", "install", "-g", "cordova"], timeout=self.timeouts.get("npm install")):
                 self.log("Failed to install Cordova. Please run 'npm install -g cordova' manually.")
                 return False
+            # PATH contents changed, resolve again
+            self.toolchain = None
+            version = self.probe_version("cordova")
+        self.log(f"Cordova {version}")
 
         self.log("Dependencies check passed.")
         return True
 
-    def wrap_project(self, target_dir, dest_dir, app_name, app_id, app_version, overwrite=False):
+    def wrap_project(self, target_dir, dest_dir, app_name, app_id, app_version, overwrite=False, incremental=False,
+                     link_mode="copy", template_dir=None, check_deps=True, optimize=False, optimize_images=False,
+                     template=None, bundle_js=False, platforms=None, preflight=True, strict_preflight=False,
+                     dedupe=False, export_path=None, export_excludes=None):
         if not os.path.exists(target_dir):
-            self.log(f"Target directory {target_dir} does not exist.")
+            self.log(f"Target directory {target_dir} does not exist.", "error")
+            return False
+
+        if link_mode not in builder_fs.LINK_MODES:
+            self.log(f"Unknown link mode '{link_mode}'. Use one of: {', '.join(builder_fs.LINK_MODES)}.", "error")
+            return False
+
+        platforms = list(dict.fromkeys(platforms or self.DEFAULT_PLATFORMS))
+        invalid = [spec for spec in platforms if not self.PLATFORM_RE.match(spec)]
+        if invalid:
+            self.log(f"Error: Invalid platform {', '.join(invalid)}. Use names like android or browser@7.0.0.")
             return False
+        if export_path:
+            try:
+                builder_export.archive_format(export_path)
+            except builder_export.ExportError as e:
+                self.log(f"Error: {e}")
+                return False
+
+        self.aborted = False
+        self.platform_results = {}
+        self.preflight_report = None
+        self.dedupe_report = None
+        self.profile = builder_profile.BuildProfile()
 
-        self.check_dependencies()
+        # The dependency check and the site scan run in the background while
+        # the template snapshot is resolved, the scan has to pass before
+        # anything is deleted or copied
+        early = ThreadPoolExecutor(max_workers=2)
+        deps_future = early.submit(self.check_dependencies) if check_deps else None
+        preflight_future = early.submit(self.scan_site, target_dir) if preflight else None
+        early.shutdown(wait=False)
+
+        # The template snapshot is only rebuilt when the template changed
+        with self.profile.span("snapshot"):
+            snapshot = self.resolve_template(template_dir, template)
+        if snapshot is None:
+            return False
+
+        if preflight and not self.check_preflight(preflight_future.result(), snapshot, strict_preflight):
+            return False
 
         # Step 1: Prepare Destination
-        self.update_progress(10, "Preparing destination folder...")
-        if os.path.exists(dest_dir):
+        self.update_progress(0, "Preparing destination folder...")
+        with self.profile.span("destination"):
+            manifest = self.prepare_destination(dest_dir, overwrite, incremental)
+        if manifest is False:
+            return False
+
+        site_dest = os.path.join(dest_dir, "www", "site")
+        fingerprints = self.load_fingerprints(dest_dir)
+        self.site_changed = None
+        if manifest is not None:
+            steps = []
+            if optimize:
+                steps.append("minify")
+            if optimize_images:
+                steps.append(self.image_step())
+            self.reset_site_steps(dest_dir, manifest, steps)
+
+        # The remaining steps form a graph: each stage starts as soon as what
+        # it needs is there. npm only needs the patched package.json, so it
+        # runs while the site is copied and index.js is patched.
+        stages = [
+            Stage("template", lambda: self.copy_template(snapshot, dest_dir, manifest,
+                                                         self.stage_progress(graph, "template", "Copying template")),
+                  provides=("config.xml", "package.json", "www/js/index.js", "template"),
+                  label="Copying template...", weight=2),
+            Stage("site", lambda: self.inject_site(target_dir, site_dest, manifest, link_mode,
+                                                   self.stage_progress(graph, "site", "Injecting website content")),
+                  provides=("www/site",), label="Injecting website content...", weight=3),
+            Stage("configure", lambda: (self.configure_config_xml(dest_dir, app_name, app_id, app_version)
+                                        and self.configure_package_json(dest_dir, app_name, app_id, app_version)),
+                  requires=("config.xml", "package.json"), provides=("config.xml:patched", "package.json:patched"),
+                  label="Configuring project..."),
+            Stage("index.js", lambda: self.patch_index_js(dest_dir),
+                  requires=("www/js/index.js",), provides=("www/js/index.js:patched",),
+                  label="Patching index.js..."),
+        ]
+
+        site_ready = "www/site"
+        if optimize:
+            stages.append(Stage("minify", lambda: self.minify_site(site_dest, manifest),
+                                requires=("www/site",), provides=("www/site:minified",),
+                                label="Minifying HTML/CSS/JS...", weight=2))
+            site_ready = "www/site:minified"
+        if optimize_images:
+            # After minify, both rewrite HTML files
+            stages.append(Stage("images", lambda: self.optimize_site_images(site_dest, manifest),
+                                requires=(site_ready,), provides=("www/site:images",),
+                                label="Optimizing images...", weight=3))
+            site_ready = "www/site:images"
+        if dedupe:
+            # Last in the site chain, the rewrite steps would split the links
+            stages.append(Stage("dedupe", lambda: self.dedupe_site(site_dest, link_mode),
+                                requires=(site_ready,), provides=("www/site:deduped",),
+                                label="Linking duplicate files..."))
+            site_ready = "www/site:deduped"
+
+        platform_requires = ["node_modules", site_ready, "www/js/index.js:patched", "config.xml:patched"]
+        if bundle_js:
+            stages.append(Stage("bundle", lambda: self.bundle_stage(dest_dir),
+                                requires=("template", "www/js/index.js:patched"), provides=("www/js:bundled",),
+                                label="Bundling app scripts..."))
+            platform_requires.append("www/js:bundled")
+
+        install_requires = ["package.json:patched"]
+        if check_deps:
+            # Batch runs check the toolchain once up front instead
+            stages.append(Stage("dependencies", lambda: deps_future.result() or True,
+                                label="Checking dependencies..."))
+            install_requires.append("dependencies")
+        if manifest is not None:
+            stages.append(Stage("inputs", lambda: self.check_project_inputs(dest_dir, manifest),
+                                requires=("config.xml:patched", "package.json:patched"),
+                                label="Checking project inputs..."))
+            stages.append(Stage("manifest", lambda: self.save_manifest(dest_dir, manifest),
+                                requires=("template", site_ready, "inputs"), label="Saving manifest..."))
+            install_requires.append("inputs")
+
+        stages.append(Stage("install", lambda: self.install_stage(dest_dir, fingerprints),
+                            requires=install_requires, provides=("node_modules",),
+                            label="Installing project dependencies (this may take a while)...", weight=5))
+        # With several platforms each is added in its own working copy at the
+        # same time, and a last stage merges package.json and node_modules
+        isolated = len(platforms) > 1
+        for spec in platforms:
+            name = spec.split("@")[0]
+            stages.append(Stage(f"platform:{name}",
+                                lambda spec=spec: self.platform_stage(dest_dir, spec, fingerprints, isolated),
+                                requires=platform_requires,
+                                label=f"Preparing Cordova platform {name}...", weight=4))
+        if isolated:
+            stages.append(Stage("platforms", lambda: self.merge_platform_packages(dest_dir),
+                                requires=[f"platform:{spec.split('@')[0]}" for spec in platforms],
+                                label="Merging platforms..."))
+        if export_path:
+            export_requires = ["platforms"] if isolated else [f"platform:{spec.split('@')[0]}" for spec in platforms]
+            if manifest is not None:
+                export_requires.append("manifest")
+            stages.append(Stage("export", lambda: self.export_project(
+                                    dest_dir, export_path, export_excludes,
+                                    self.stage_progress(graph, "export", "Exporting project")),
+                                requires=export_requires, label="Exporting project...", weight=2))
+
+        graph = StageGraph(stages, progress=self.update_progress, should_stop=lambda: self.aborted,
+                           profile=self.profile)
+        success = graph.run(workers=self.stage_workers)
+
+        for stage in graph.stages:
+            if stage.error is not None:
+                self.log(f"Error in stage '{stage.name}': {stage.error}")
+        if os.path.isdir(dest_dir):
+            self.save_fingerprints(dest_dir, fingerprints)
+        shutil.rmtree(os.path.join(dest_dir, self.PLATFORM_WORK_DIR), ignore_errors=True)
+        self.report_stage_timings(graph)
+
+        if self.check_cancelled() or not success:
+            return False
+
+        # Step 6: Finalize
+        self.update_progress(100, "Done!")
+        return True
+
+    def scan_site(self, target_dir):
+        with self.profile.span("preflight"):
+            try:
+                return builder_preflight.scan_site(target_dir, self.cache_dir)
+            except Exception as e:
+                return {"index": {}, "total_size": 0, "references": 0, "from_cache": 0,
+                        "errors": [f"Could not scan the website folder: {e}"], "warnings": []}
+
+    def check_template(self, snapshot):
+        # Problems configure_project and patch_index_js would only hit
+        # after the copies, as a list of messages
+        errors = []
+        try:
+            root = ET.parse(os.path.join(snapshot, "config.xml")).getroot()
+            if root.tag.rsplit('}', 1)[-1] != "widget":
+                errors.append("Template config.xml has no <widget> root element")
+        except Exception as e:
+            errors.append(f"Template config.xml can't be read: {e}")
+        try:
+            with open(os.path.join(snapshot, "package.json"), 'r') as f:
+                json.load(f)
+        except Exception as e:
+            errors.append(f"Template package.json can't be read: {e}")
+        try:
+            with open(os.path.join(snapshot, "www", "js", "index.js"), 'r') as f:
+                content = f.read()
+            for name, pattern in (("LANDING_URL", self.LANDING_URL_PATTERN),
+                                  ("SPLIT_URL_RE", self.SPLIT_URL_RE_PATTERN)):
+                if not re.search(pattern, content):
+                    errors.append(f"Template www/js/index.js has no {name} line to patch")
+        except Exception as e:
+            errors.append(f"Template www/js/index.js can't be read: {e}")
+        return errors
+
+    def check_preflight(self, report, snapshot, strict=False):
+        # Logs the scan and returns False when the wrap should not start
+        self.preflight_report = report
+        errors = report["errors"] + self.check_template(snapshot)
+        warnings = report["warnings"]
+        self.log(f"Pre-flight: {len(report['index'])} files, {builder_profile.format_bytes(report['total_size'])}, "
+                 f"{report['references']} references checked ({report['from_cache']} files from cache), "
+                 f"{len(errors)} errors, {len(warnings)} warnings.")
+        for message in errors:
+            self.log(f"Error: {message}")
+        for kind, message in warnings[:self.PREFLIGHT_LOG_LIMIT]:
+            self.log(f"Warning: {message}")
+        if len(warnings) > self.PREFLIGHT_LOG_LIMIT:
+            self.log(f"Warning: ... and {len(warnings) - self.PREFLIGHT_LOG_LIMIT} more.")
+        if errors or (strict and warnings):
+            self.log("Error: Pre-flight check failed, nothing was copied.")
+            return False
+        return True
+
+    def prepare_destination(self, dest_dir, overwrite, incremental):
+        # Returns the manifest to sync against (None for a full copy), or
+        # False when the destination can't be used
+        manifest = None
+        if incremental:
+            manifest = self.load_manifest(dest_dir)
+            if manifest is not None:
+                self.log(f"Destination {dest_dir} is a wrapped project. Syncing changes only...")
+
+        if manifest is None and os.path.exists(dest_dir):
             if not overwrite:
-                self.log(f"Destination {dest_dir} exists. Aborting to prevent data loss.")
+                self.log(f"Destination {dest_dir} exists. Aborting to prevent data loss.", "error")
                 return False
 
             self.log(f"Destination {dest_dir} exists. Cleaning up...")
@@ -93,57 +622,705 @@ class CordovaWrapperBuilder:
                 self.log(f"Could not delete destination: {e}")
                 return False
 
-        # Copy template (current directory) to destination
-        # We need to exclude typical ignore files
-        template_dir = os.getcwd()
-        ignore_patterns = shutil.ignore_patterns(
-            '.git', '.gitignore', 'node_modules', 'platforms', 'plugins',
-            '*.py', '__pycache__', 'test_site', 'test_output', '.DS_Store'
-        )
+        if incremental and manifest is None:
+            manifest = builder_fs.FileManifest()
+        return manifest
+
+    def report_stage_timings(self, graph):
+        self.stage_timings = graph.timings()
+        self.log("Build profile:")
+        for line in self.profile.summary_lines():
+            self.log(f"  {line}")
+        skipped = [timing["stage"] for timing in self.stage_timings if timing["status"] != "done"]
+        if skipped:
+            self.log(f"Not completed: {', '.join(skipped)}")
+        path = graph.critical_path()
+        if path:
+            total = sum(stage.duration for stage in path)
+            self.log(f"Critical path: {' -> '.join(stage.name for stage in path)} ({total:.2f}s)")
+
+    def export_project(self, dest_dir, archive_path, excludes=None, progress=None):
+        # Packs the project into a reproducible zip/tar.gz/tar, see
+        # builder_export. node_modules and platforms are left out by default.
+        excludes = builder_export.DEFAULT_EXCLUDES if excludes is None else tuple(excludes)
+        try:
+            result = builder_export.export_project(dest_dir, archive_path, excludes=excludes + (self.PLATFORM_WORK_DIR,),
+                                                   progress=progress)
+        except builder_fs.Cancelled:
+            return False
+        except (builder_export.ExportError, OSError) as e:
+            self.log(f"Could not export project: {e}")
+            return False
+        self.log(f"Exported {result['files']} files ({builder_profile.format_bytes(result['size'])}) to "
+                 f"{archive_path} ({builder_profile.format_bytes(result['archive_size'])}).")
+        span = self.profile.current()
+        if span is not None:
+            span.add(files=result["files"], bytes=result["size"])
+        return True
+
+    def watch_project(self, target_dir, dest_dir, link_mode="copy", prepare=False, poll=False):
+        """Keep www/site of a wrapped project in sync with target_dir until cancel().
+
+        Changes are picked up through inotify (or by polling), debounced and
+        only the affected files are copied or deleted. With prepare,
+        `cordova prepare` runs after every sync. Dependencies and platforms
+        are never touched.
+        """
+        if not os.path.isdir(target_dir):
+            self.log(f"Target directory {target_dir} does not exist.", "error")
+            return False
+        if not os.path.isfile(os.path.join(dest_dir, "config.xml")):
+            self.log(f"Error: {dest_dir} is not a wrapped project. Wrap the site first.")
+            return False
+        if link_mode not in builder_fs.LINK_MODES:
+            self.log(f"Unknown link mode '{link_mode}'. Use one of: {', '.join(builder_fs.LINK_MODES)}.", "error")
+            return False
+
+        self.aborted = False
+        site_dest = os.path.join(dest_dir, "www", "site")
+        manifest = self.load_manifest(dest_dir) or builder_fs.FileManifest()
+        try:
+            watcher = builder_watch.make_watcher(target_dir, poll)
+        except OSError as e:
+            self.log(f"Error: Could not watch {target_dir}: {e}")
+            return False
+        how = "inotify" if isinstance(watcher, builder_watch.InotifyWatcher) else f"polling every {watcher.interval}s"
+        self.log(f"Watching {target_dir} for changes ({how}). Cancel to stop.")
+
+        syncs = 0
+        # The first sync catches up with edits made since the last wrap
+        paths = {""}
+        try:
+            while paths:
+                start = time.perf_counter()
+                try:
+                    stats = builder_fs.sync_paths(target_dir, site_dest, manifest.section("site"), paths,
+                                                  engine=self.copy_engine, link_mode=link_mode)
+                except OSError as e:
+                    # Usually a file that disappeared mid-sync, its own event follows
+                    self.log(f"Warning: Could not sync {', '.join(sorted(paths)[:5])}: {e}")
+                    stats = None
+                if stats is not None and (stats.copied or stats.deleted):
+                    self.save_manifest(dest_dir, manifest)
+                    syncs += 1
+                    self.log(f"Synced {stats.copied} changed, {stats.deleted} deleted "
+                             f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+                    if prepare:
+                        self.run_command(["cordova", "prepare"], cwd=dest_dir, timeout=self.timeouts.get("prepare"))
+                self.update_progress(100, f"Watching for changes ({syncs} syncs)")
+                paths = builder_watch.next_batch(watcher, lambda: self.aborted)
+        finally:
+            watcher.close()
+        self.log("Stopped watching.")
+        return True
+
+    def export_profile(self, path, fmt="json"):
+        # fmt "json" writes the raw profile, "trace" a Chrome trace-event file
+        if fmt == "trace":
+            self.profile.export_trace(path)
+        else:
+            self.profile.export_json(path)
 
+    def resolve_template(self, template_dir=None, template=None):
+        # Snapshot folder to clone the project from: the registered template
+        # `template`, or a snapshot of template_dir (the builder's own folder
+        # by default), refreshed when the folder changed. None on failure.
         try:
-            shutil.copytree(template_dir, dest_dir, ignore=ignore_patterns)
+            if template:
+                snapshot = self.templates.get(template)
+                if snapshot is None:
+                    self.log(f"Template '{template}' is not registered.", "error")
+                return snapshot
+            template_dir = template_dir or self.TEMPLATE_DIR
+            return self.templates.add(builder_templates.source_name(template_dir), template_dir)
+        except (builder_templates.TemplateError, OSError) as e:
+            self.log(f"Could not prepare template: {e}")
+            return None
+
+    def copy_template(self, snapshot, dest_dir, manifest, progress):
+        # Files the build writes to are always real copies, the rest is
+        # cloned from the snapshot with template_link_mode
+        files = self.templates.files(snapshot)
+        writable = [rel for rel in files if rel in self.WRITABLE_FILES]
+        try:
+            if manifest is not None:
+                def ignore(directory, names):
+                    rel_dir = os.path.relpath(directory, snapshot).replace(os.sep, "/")
+                    prefix = "" if rel_dir == "." else rel_dir + "/"
+                    return [name for name in names
+                            if prefix + name in writable or prefix + name == builder_templates.SNAPSHOT_INFO]
+
+                stats = builder_fs.sync_tree(
+                    snapshot, dest_dir, manifest.section("template"), ignore=ignore,
+                    engine=self.copy_engine, progress=progress, link_mode=self.template_link_mode,
+                    on_copied=self.profile.counter()
+                )
+                self.log(f"Template sync: {stats}")
+            else:
+                jobs = [(os.path.join(snapshot, rel), os.path.join(dest_dir, rel), size)
+                        for rel, size in files.items() if rel not in writable]
+                self.copy_engine.copy_files(jobs, progress=progress, link_mode=self.template_link_mode,
+                                            on_copied=self.profile.counter())
+            self.copy_engine.copy_files([(os.path.join(snapshot, rel), os.path.join(dest_dir, rel), files[rel])
+                                         for rel in writable], on_copied=self.profile.counter())
+        except builder_fs.Cancelled:
+            return False
         except Exception as e:
             self.log(f"Error copying template: {e}")
             return False
+        return True
 
-        # Step 2: Inject Content
-        self.update_progress(30, "Injecting website content...")
-        site_dest = os.path.join(dest_dir, "www", "site")
+    def inject_site(self, target_dir, site_dest, manifest, link_mode, progress):
         try:
-            shutil.copytree(target_dir, site_dest)
+            if manifest is not None:
+                stats = builder_fs.sync_tree(
+                    target_dir, site_dest, manifest.section("site"),
+                    engine=self.copy_engine, progress=progress, link_mode=link_mode,
+                    on_copied=self.profile.counter()
+                )
+                self.log(f"Site sync: {stats}")
+                self.site_changed = stats.changed
+                used_mode = stats.link_mode
+            else:
+                used_mode = self.copy_engine.copy_tree(target_dir, site_dest, progress=progress,
+                                                       link_mode=link_mode, on_copied=self.profile.counter())
+            if used_mode != link_mode:
+                self.log(f"Link mode '{link_mode}' is not supported here, fell back to '{used_mode}'.")
+        except builder_fs.Cancelled:
+            return False
         except Exception as e:
             self.log(f"Error copying site content: {e}")
             return False
+        return True
+
+    def reset_site_steps(self, dest_dir, manifest, enabled):
+        # Files rewritten by a step that is now turned off are dropped from
+        # the manifest, so the site stage copies the originals again
+        site_dest = os.path.join(dest_dir, "www", "site")
+        entries = manifest.section("site")
+        for rel in [rel for rel, entry in entries.items() if set(entry.get("steps", ())) - set(enabled)]:
+            dest = entries.pop(rel).get("dest", rel)
+            if dest != rel:
+                try:
+                    os.remove(os.path.join(site_dest, dest))
+                except FileNotFoundError:
+                    pass
+
+    def site_step_paths(self, site_dest, manifest, step):
+        # Everything for a full copy, else changed files plus any the step
+        # has not seen yet (it was off in the previous run)
+        if manifest is None:
+            return builder_optimize.site_files(site_dest)
+        paths = set(self.site_changed or ())
+        paths.update(rel for rel, entry in manifest.section("site").items() if step not in entry.get("steps", ()))
+        return sorted(paths)
+
+    def mark_site_file(self, manifest, rel, step, size, dest=None):
+        # Records what a step wrote for rel, so the next sync can tell it
+        # apart from a modified file
+        if manifest is None or rel not in manifest.section("site"):
+            return
+        entry = manifest.section("site")[rel]
+        entry["dest_size"] = size
+        if dest is not None and dest != rel:
+            entry["dest"] = dest
+        if step not in entry.setdefault("steps", []):
+            entry["steps"].append(step)
+
+    def report_savings(self, verb, report, counter):
+        saved_total = 0
+        for ext, entry in sorted(report.items()):
+            saved = entry["before"] - entry["after"]
+            saved_total += saved
+            self.log(f"{verb} {ext}: {entry['files']} files, {builder_profile.format_bytes(entry['before'])} -> "
+                     f"{builder_profile.format_bytes(entry['after'])} (saved {builder_profile.format_bytes(saved)}, "
+                     f"{entry['cached']} from cache)")
+        span = self.profile.current()
+        if span is not None:
+            span.add(bytes_saved=saved_total, **{counter: sum(entry["files"] for entry in report.values())})
+
+    def minify_site(self, site_dest, manifest):
+        # Minifies what the site stage copied. Results are cached by content
+        # hash, so unchanged files cost a read and a hash lookup.
+        if self.aborted:
+            return False
+        paths = self.site_step_paths(site_dest, manifest, "minify")
+        try:
+            sizes, report = builder_optimize.minify_tree(site_dest, paths, self.cache_dir)
+        except Exception as e:
+            # The unminified site is still usable
+            self.log(f"Warning: Minification failed: {e}")
+            return True
+
+        for rel, size in sizes.items():
+            self.mark_site_file(manifest, rel, "minify", size)
+        self.report_savings("Minified", report, "minified")
+        return True
+
+    def dedupe_site(self, site_dest, link_mode):
+        # Files with the same content are hardlinked to one copy. Hardlinked
+        # and symlinked sites point into the source folder, so there the
+        # duplicates are only reported.
+        if self.aborted:
+            return False
+        try:
+            groups = builder_fs.find_duplicates(site_dest, self.copy_engine)
+        except OSError as e:
+            self.log(f"Warning: Could not look for duplicate files: {e}")
+            return True
+
+        wasted = sum(size * (len(paths) - 1) for size, paths in groups)
+        self.dedupe_report = {
+            "groups": [{"size": size, "paths": paths} for size, paths in groups],
+            "files": sum(len(paths) - 1 for _, paths in groups),
+            "wasted": wasted,
+            "linked": 0,
+        }
+        if not groups:
+            self.log("No duplicate files in the website content.")
+            return True
+        self.log(f"Found {self.dedupe_report['files']} duplicate files in {len(groups)} groups, "
+                 f"{builder_profile.format_bytes(wasted)} wasted.")
+        for size, paths in groups[:self.DEDUPE_LOG_GROUPS]:
+            self.log(f"  {builder_profile.format_bytes(size)} x {len(paths)}: {', '.join(paths)}", "debug")
+        if len(groups) > self.DEDUPE_LOG_GROUPS:
+            self.log(f"  ... and {len(groups) - self.DEDUPE_LOG_GROUPS} more groups", "debug")
+
+        if link_mode not in ("copy", "reflink"):
+            return True
+        try:
+            linked, saved = builder_fs.link_duplicates(site_dest, groups)
+        except OSError as e:
+            self.log(f"Warning: Could not hardlink duplicate files: {e}")
+            return True
+        self.dedupe_report["linked"] = linked
+        self.log(f"Hardlinked {linked} duplicate files (saved {builder_profile.format_bytes(saved)}).")
+        span = self.profile.current()
+        if span is not None:
+            span.add(bytes_saved=saved, deduped=linked)
+        return True
+
+    def image_settings(self):
+        # What the image pipeline can actually do here
+        has_pil, has_webp = builder_optimize.can_transcode()
+        return {
+            "max_size": self.image_max_size if has_pil else None,
+            "webp": bool(self.image_webp and has_webp),
+            "quality": self.image_quality,
+        }
+
+    def image_step(self):
+        # Step name recorded in the manifest, images are redone when the
+        # settings change
+        key = json.dumps(self.image_settings(), sort_keys=True)
+        return "images:" + hashlib.sha256(key.encode()).hexdigest()[:8]
+
+    def optimize_site_images(self, site_dest, manifest):
+        # Lossless PNG recompression, plus resizing and WebP with Pillow.
+        # Cached by content hash and settings.
+        if self.aborted:
+            return False
+        has_pil, has_webp = builder_optimize.can_transcode()
+        if (self.image_max_size or self.image_webp) and not has_pil:
+            self.log("Warning: Pillow is not installed, images are only recompressed losslessly.")
+        elif self.image_webp and not has_webp:
+            self.log("Warning: Pillow was built without WebP support, images keep their format.")
+        settings = self.image_settings()
+        step = self.image_step()
+
+        paths = self.site_step_paths(site_dest, manifest, step)
+        try:
+            outputs, report = builder_optimize.optimize_images(site_dest, paths, self.cache_dir, settings)
+            renames = {rel: new_rel for rel, (new_rel, _) in outputs.items() if new_rel != rel}
+            converted = len(renames)
+            if manifest is not None:
+                # Files renamed by earlier runs are still referenced by name
+                renames.update((rel, entry["dest"]) for rel, entry in manifest.section("site").items()
+                               if "dest" in entry and rel not in outputs)
+            rewritten = builder_optimize.rewrite_references(site_dest, renames) if renames else {}
+        except Exception as e:
+            self.log(f"Warning: Image optimization failed: {e}")
+            return True
 
-        # Step 3: Configure Project
-        self.update_progress(50, "Configuring project...")
-        if not self.configure_project(dest_dir, app_name, app_id, app_version):
+        for rel, (new_rel, size) in outputs.items():
+            self.mark_site_file(manifest, rel, step, size, new_rel)
+        for rel, size in rewritten.items():
+            self.mark_site_file(manifest, rel, step, size)
+        if converted:
+            self.log(f"Converted {converted} images to WebP, updated references in {len(rewritten)} files.")
+        self.report_savings("Optimized", report, "images")
+        return True
+
+    def bundle_stage(self, dest_dir):
+        # One minified script instead of the five index.html loads, with
+        # unused lodash methods dropped. Not fatal, the scripts still work
+        # on their own.
+        if self.aborted:
             return False
+        try:
+            result = builder_bundle.bundle_www(os.path.join(dest_dir, "www"), self.cache_dir)
+        except Exception as e:
+            self.log(f"Warning: Could not bundle the app scripts: {e}")
+            return True
+        if result is None:
+            self.log("No scripts to bundle in www/index.html.")
+            return True
+
+        message = (f"Bundled {len(result['scripts'])} scripts into {builder_bundle.BUNDLE_NAME}: "
+                   f"{builder_profile.format_bytes(result['before'])} -> {builder_profile.format_bytes(result['after'])}")
+        if result["removed"]:
+            message += f", dropped {len(result['removed'])} unused lodash methods"
+        if result["from_cache"]:
+            message += " (from cache)"
+        self.log(message)
+        span = self.profile.current()
+        if span is not None:
+            span.add(bytes_saved=result["before"] - result["after"])
+        return True
+
+    def manifest_key(self, dest_dir):
+        try:
+            st = os.stat(os.path.join(dest_dir, builder_fs.MANIFEST_NAME))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load_manifest(self, dest_dir):
+        # The manifest the last wrap of dest_dir kept in memory, as long as
+        # the file on disk is still the one it wrote
+        if self.manifests is not None:
+            key, manifest = self.manifests.pop(os.path.abspath(dest_dir), (None, None))
+            if manifest is not None and key == self.manifest_key(dest_dir):
+                return manifest
+        return builder_fs.FileManifest.load(dest_dir)
 
-        # Step 4: Install Dependencies (in the new project)
-        self.update_progress(70, "Installing project dependencies (this may take a while)...")
-        # Run npm install in dest_dir
-        if not self.run_command(["npm", "install"], cwd=dest_dir):
+    def save_manifest(self, dest_dir, manifest):
+        try:
+            manifest.save(dest_dir)
+            if self.manifests is not None:
+                self.manifests[os.path.abspath(dest_dir)] = (self.manifest_key(dest_dir), manifest)
+        except Exception as e:
+            self.log(f"Warning: Could not save manifest: {e}")
+        return True
+
+    def install_stage(self, dest_dir, fingerprints):
+        # A failed install is not fatal, the user can still run it by hand
+        if not self.install_dependencies(dest_dir, fingerprints):
+            if self.aborted:
+                return False
             self.log("Warning: npm install failed. You may need to run it manually.")
+        return True
+
+    def platform_stage(self, dest_dir, spec, fingerprints, isolated=False):
+        # `cordova platform add <spec>`, in the project itself or, when
+        # isolated, in a working copy whose platform and plugins are then
+        # moved into the project. A failed add is reported, not fatal.
+        name = spec.split("@")[0]
+        start = time.perf_counter()
+        key = f"platform:{name}"
+        fingerprint = self.compute_fingerprint(dest_dir, "platform")
+        platform_dir = os.path.join(dest_dir, "platforms", name)
+        if fingerprints.get(key) == fingerprint and os.path.isdir(platform_dir):
+            self.update_progress(self.progress_percent, f"Platform {name} inputs unchanged, skipping platform add.")
+            status = "unchanged"
+        elif os.path.isdir(platform_dir):
+            # Only possible in incremental mode, where check_project_inputs kept it
+            self.log(f"Platform {name} already present, skipping platform add.")
+            fingerprints[key] = fingerprint
+            status = "present"
+        else:
+            try:
+                cwd = self.platform_workdir(dest_dir, name) if isolated else dest_dir
+            except Exception as e:
+                self.log(f"Warning: Could not prepare a working copy for {name}: {e}")
+                cwd = None
+            if cwd is not None and self.run_command(["cordova", "platform", "add", spec], cwd=cwd,
+                                                    timeout=self.timeouts.get("platform add")):
+                status = "added"
+                if isolated:
+                    try:
+                        with self._platform_lock:
+                            self.merge_platform(cwd, dest_dir, name)
+                    except Exception as e:
+                        self.log(f"Warning: Could not merge the {name} platform: {e}")
+                        status = "failed"
+            else:
+                status = "failed"
+            if self.aborted:
+                return False
+            if status == "failed":
+                hint = " Ensure Android SDK is set up." if name == "android" else ""
+                self.log(f"Warning: Could not add {name} platform.{hint}")
+                fingerprints.pop(key, None)
+            else:
+                fingerprints[key] = fingerprint
 
-        # Step 5: Prepare Cordova
-        self.update_progress(85, "Preparing Cordova platform...")
-        # Add android platform (as default example) or just prepare
-        # Using 'cordova prepare' is safer as it uses config.xml
-        # But usually you need to add a platform first.
-        # Let's try adding android. If it exists or fails, we'll try prepare.
+        duration = time.perf_counter() - start
+        self.platform_results[name] = {"status": status, "duration": round(duration, 3)}
+        self.log(f"Platform {name}: {status} ({duration:.2f}s)")
+        return True
 
-        # Note: In a real scenario, we might ask the user which platform.
-        # For now, we follow the README: 'cordova platform add android'
-        if not self.run_command(["cordova", "platform", "add", "android"], cwd=dest_dir):
-            self.log("Warning: Could not add Android platform. Ensure Android SDK is set up.")
+    def platform_workdir(self, dest_dir, name):
+        # A copy of the project for one `cordova platform add`, with www,
+        # res, plugins and node_modules linked rather than copied
+        work = os.path.join(dest_dir, self.PLATFORM_WORK_DIR, name)
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        for entry in ("config.xml", "package.json", "package-lock.json"):
+            if os.path.isfile(os.path.join(dest_dir, entry)):
+                shutil.copy2(os.path.join(dest_dir, entry), os.path.join(work, entry))
+        for entry, link_mode in (("www", "hardlink"), ("res", "hardlink"), ("plugins", "hardlink"),
+                                 ("node_modules", self.npm_link_mode)):
+            if os.path.isdir(os.path.join(dest_dir, entry)):
+                self.copy_engine.copy_tree(os.path.join(dest_dir, entry), os.path.join(work, entry),
+                                           link_mode=link_mode, on_copied=self.profile.counter())
 
-        # Step 6: Finalize
-        self.update_progress(100, "Done!")
+        # State files npm and cordova rewrite in place must not be shared
+        # with the project through a hardlink
+        shared = [os.path.join(work, "node_modules", ".package-lock.json")]
+        if os.path.isdir(os.path.join(work, "plugins")):
+            shared += [os.path.join(work, "plugins", entry) for entry in os.listdir(os.path.join(work, "plugins"))
+                       if entry.endswith(".json")]
+        builder_fs.unshare_files(shared)
+        return work
+
+    def merge_platform(self, work, dest_dir, name):
+        # Moves platforms/<name> and the plugins installed for it into the
+        # project. Called with _platform_lock held.
+        target = os.path.join(dest_dir, "platforms", name)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(os.path.join(work, "platforms", name), target)
+
+        plugins = os.path.join(work, "plugins")
+        if not os.path.isdir(plugins):
+            return
+        os.makedirs(os.path.join(dest_dir, "plugins"), exist_ok=True)
+        for entry in os.listdir(plugins):
+            src = os.path.join(plugins, entry)
+            dst = os.path.join(dest_dir, "plugins", entry)
+            if entry == f"{name}.json":
+                os.replace(src, dst)
+            elif entry == "fetch.json":
+                merged = builder_fs.read_json(src, {})
+                merged.update(builder_fs.read_json(dst, {}))
+                builder_fs.write_json(dst, merged, indent=2)
+            elif not os.path.exists(dst):
+                os.rename(src, dst)
+
+    def merge_platform_packages(self, dest_dir):
+        # What `platform add` added to package.json and node_modules in the
+        # working copies, merged into the project once all platforms are done
+        work_root = os.path.join(dest_dir, self.PLATFORM_WORK_DIR)
+        pkg_path = os.path.join(dest_dir, "package.json")
+        try:
+            with open(pkg_path, 'r') as f:
+                data = json.load(f)
+            for name in sorted(os.listdir(work_root)) if os.path.isdir(work_root) else []:
+                if self.platform_results.get(name, {}).get("status") != "added":
+                    continue
+                work = os.path.join(work_root, name)
+                with open(os.path.join(work, "package.json"), 'r') as f:
+                    work_data = json.load(f)
+                for field in ("dependencies", "devDependencies"):
+                    for package, version in work_data.get(field, {}).items():
+                        data.setdefault(field, {}).setdefault(package, version)
+                work_cordova = work_data.get("cordova", {})
+                cordova = data.setdefault("cordova", {})
+                for platform_name in work_cordova.get("platforms", []):
+                    if platform_name not in cordova.setdefault("platforms", []):
+                        cordova["platforms"].append(platform_name)
+                for plugin, variables in work_cordova.get("plugins", {}).items():
+                    cordova.setdefault("plugins", {}).setdefault(plugin, variables)
+                self.merge_node_modules(os.path.join(work, "node_modules"), os.path.join(dest_dir, "node_modules"))
+            with open(pkg_path, 'w') as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            self.log(f"Warning: Could not merge the platforms' packages: {e}")
         return True
 
+    def merge_node_modules(self, src, dst):
+        # Moves packages (and their .bin links) that dst does not have yet
+        if not os.path.isdir(src):
+            return
+        os.makedirs(dst, exist_ok=True)
+        for entry in os.listdir(src):
+            if entry == ".package-lock.json":
+                continue
+            if entry == ".bin" or entry.startswith("@"):
+                self.merge_node_modules(os.path.join(src, entry), os.path.join(dst, entry))
+            elif not os.path.lexists(os.path.join(dst, entry)):
+                os.rename(os.path.join(src, entry), os.path.join(dst, entry))
+
+    def install_dependencies(self, dest_dir, fingerprints):
+        # Make sure dest_dir/node_modules matches package.json, preferring (in
+        # order) the existing tree, a seed from the npm store and npm itself
+        node_modules = os.path.join(dest_dir, "node_modules")
+        fingerprint = self.compute_fingerprint(dest_dir, "npm")
+        if fingerprints.get("npm") == fingerprint and os.path.isdir(node_modules):
+            self.update_progress(self.progress_percent, "Dependencies unchanged, skipping npm install.")
+            return True
+        fingerprints.pop("npm", None)
+
+        store_key = self.npm_store_key(dest_dir)
+        store_modules = os.path.join(self.cache_dir, "npm-store", store_key, "node_modules")
+        if self.use_npm_store and not os.path.exists(node_modules) and os.path.isdir(store_modules):
+            self.update_progress(self.progress_percent, "Seeding node_modules from the npm store...")
+            try:
+                used_mode = self.copy_engine.copy_tree(store_modules, node_modules, link_mode=self.npm_link_mode,
+                                                       on_copied=self.profile.counter())
+                # npm and cordova rewrite the hidden lockfile in place, which
+                # would change the store's copy through a link
+                builder_fs.unshare_files([os.path.join(node_modules, ".package-lock.json")])
+                os.utime(os.path.dirname(store_modules))
+            except builder_fs.Cancelled:
+                return False
+            except Exception as e:
+                self.log(f"Warning: Could not seed node_modules from the npm store: {e}")
+                shutil.rmtree(node_modules, ignore_errors=True)
+            else:
+                self.log(f"Seeded node_modules from the npm store ({used_mode}).")
+                fingerprints["npm"] = fingerprint
+                return True
+
+        npm_flags = ["--prefer-offline", "--no-audit", "--no-fund",
+                     "--cache", os.path.join(self.cache_dir, "npm-cache")]
+        if self.offline:
+            npm_flags.append("--offline")
+        timeout = self.timeouts.get("npm install")
+
+        # npm ci is faster and exact, but needs a lockfile that matches package.json
+        installed = False
+        if os.path.exists(os.path.join(dest_dir, "package-lock.json")) and not os.path.exists(node_modules):
+            installed = self.run_command(["npm", "ci"] + npm_flags, cwd=dest_dir, timeout=timeout)
+            if not installed and not self.aborted:
+                self.log("npm ci failed, falling back to npm install.")
+        if not installed and not self.aborted:
+            installed = self.run_command(["npm", "install"] + npm_flags, cwd=dest_dir, timeout=timeout)
+        if not installed:
+            return False
+
+        # Recorded from the inputs as they were before npm ran: npm rewrites
+        # package-lock.json to match package.json, but the next build starts
+        # again from the template's lockfile
+        fingerprints["npm"] = fingerprint
+        if self.use_npm_store and not os.path.isdir(store_modules):
+            self.add_to_npm_store(node_modules, store_key)
+        return True
+
+    def npm_store_key(self, dest_dir):
+        # Identifies an installed node_modules tree: the dependency part of the
+        # lockfile (or package.json without one) plus the node version and OS
+        h = hashlib.sha256()
+        h.update(f"{self.probe_version('node')}\0{sys.platform}\0{platform.machine()}\0".encode())
+        lock = builder_fs.read_json(os.path.join(dest_dir, "package-lock.json"))
+        if isinstance(lock, dict):
+            # The root entry carries the per-app name and version
+            lock = dict(lock)
+            lock.pop("name", None)
+            lock.pop("version", None)
+            packages = dict(lock.get("packages") or {})
+            root = dict(packages.get("", {}))
+            root.pop("name", None)
+            root.pop("version", None)
+            packages[""] = root
+            lock["packages"] = packages
+            h.update(b"lock\0" + json.dumps(lock, sort_keys=True).encode())
+        else:
+            pkg = builder_fs.read_json(os.path.join(dest_dir, "package.json"), {})
+            deps = {field: pkg.get(field) for field in self.NPM_DEPENDENCY_FIELDS}
+            h.update(b"package\0" + json.dumps(deps, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def add_to_npm_store(self, node_modules, store_key):
+        # Real copy into a temporary folder, then renamed into place so
+        # concurrent jobs never see a partial tree
+        store_root = os.path.join(self.cache_dir, "npm-store")
+        os.makedirs(store_root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=store_root, prefix=".tmp-")
+        try:
+            self.update_progress(self.progress_percent, "Saving node_modules to the npm store...")
+            self.copy_engine.copy_tree(node_modules, os.path.join(tmp_dir, "node_modules"),
+                                       on_copied=self.profile.counter())
+            os.rename(tmp_dir, os.path.join(store_root, store_key))
+        except Exception as e:
+            # Also hit when another job stored the same key first
+            if not os.path.isdir(os.path.join(store_root, store_key)):
+                self.log(f"Warning: Could not add node_modules to the npm store: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        # Evict the least recently used trees
+        entries = [os.path.join(store_root, name) for name in os.listdir(store_root) if not name.startswith(".")]
+        entries.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+        for path in entries[self.NPM_STORE_SIZE:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def check_project_inputs(self, dest_dir, manifest):
+        # node_modules, platforms and plugins are derived from package.json and
+        # config.xml. Keep them when both are unchanged, otherwise start clean.
+        inputs = {}
+        for name in ("package.json", "config.xml"):
+            inputs[name] = builder_fs.hash_file(os.path.join(dest_dir, name))
+
+        if manifest.inputs and manifest.inputs != inputs:
+            self.log("package.json or config.xml changed. Removing node_modules, platforms and plugins...")
+            for name in self.DERIVED_DIRS:
+                path = os.path.join(dest_dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+        elif manifest.inputs:
+            self.log("package.json and config.xml unchanged. Keeping node_modules and platforms.")
+        manifest.inputs = inputs
+        return True
+
+    def compute_fingerprint(self, dest_dir, step):
+        # Hash of everything the npm / cordova step depends on
+        h = hashlib.sha256()
+
+        def add(label, data):
+            h.update(label.encode() + b"\0")
+            h.update(data if isinstance(data, bytes) else str(data).encode())
+            h.update(b"\0")
+
+        add("node", self.probe_version("node"))
+        if step == "npm":
+            add("npm", self.probe_version("npm"))
+            for name in ("package.json", "package-lock.json"):
+                path = os.path.join(dest_dir, name)
+                add(name, builder_fs.hash_file(path) if os.path.exists(path) else "")
+        else:
+            add("cordova", self.probe_version("cordova"))
+            try:
+                with open(os.path.join(dest_dir, "package.json"), 'r') as f:
+                    add("package.json:cordova", json.dumps(json.load(f).get("cordova", {}), sort_keys=True))
+                root = ET.parse(os.path.join(dest_dir, "config.xml")).getroot()
+            except Exception as e:
+                # Unreadable inputs never match a stored fingerprint
+                add("error", e)
+            else:
+                for elem in root:
+                    tag = elem.tag.rsplit('}', 1)[-1]
+                    if tag in ("plugin", "platform", "engine"):
+                        add("config.xml:" + tag, ET.tostring(elem))
+        return h.hexdigest()
+
+    def load_fingerprints(self, dest_dir):
+        fingerprints = builder_fs.read_json(os.path.join(dest_dir, builder_fs.FINGERPRINT_NAME), {})
+        return fingerprints if isinstance(fingerprints, dict) else {}
+
+    def save_fingerprints(self, dest_dir, fingerprints):
+        try:
+            builder_fs.write_json(os.path.join(dest_dir, builder_fs.FINGERPRINT_NAME), fingerprints, indent=2)
+        except Exception as e:
+            self.log(f"Warning: Could not save build fingerprint: {e}")
+
     def configure_project(self, dest_dir, app_name, app_id, version):
+        return (self.configure_config_xml(dest_dir, app_name, app_id, version)
+                and self.configure_package_json(dest_dir, app_name, app_id, version)
+                and self.patch_index_js(dest_dir))
+
+    def configure_config_xml(self, dest_dir, app_name, app_id, version):
         # 1. Update config.xml
         config_path = os.path.join(dest_dir, "config.xml")
         try:
@@ -172,7 +1349,9 @@ class CordovaWrapperBuilder:
         except Exception as e:
             self.log(f"Error updating config.xml: {e}")
             return False
+        return True
 
+    def configure_package_json(self, dest_dir, app_name, app_id, version):
         # 2. Update package.json
         pkg_path = os.path.join(dest_dir, "package.json")
         try:
@@ -189,7 +1368,9 @@ class CordovaWrapperBuilder:
         except Exception as e:
             self.log(f"Error updating package.json: {e}")
             return False
+        return True
 
+    def patch_index_js(self, dest_dir):
         # 3. Patch www/js/index.js
         js_path = os.path.join(dest_dir, "www", "js", "index.js")
         try:
@@ -210,7 +1391,7 @@ var LANDING_URL = root + LANDING_PATH;
 """
             # Regex to find the original LANDING_URL line
             new_content = re.sub(
-                r'var\s+LANDING_URL\s*=\s*".*?";',
+                self.LANDING_URL_PATTERN,
                 new_landing_logic,
                 content,
                 count=1
@@ -229,7 +1410,7 @@ var LANDING_URL = root + LANDING_PATH;
             new_regex = r'var SPLIT_URL_RE = /^((?:[^:/]+:\/\/[^/]*)?)(\/[^?]*)(?:\?([^#]*))?(?:#(.*))?$/i;'
 
             new_content = re.sub(
-                r'var\s+SPLIT_URL_RE\s*=.*;',
+                self.SPLIT_URL_RE_PATTERN,
                 new_regex,
                 content,
                 count=1
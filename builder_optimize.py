@@ -0,0 +1,615 @@
+import os
+import re
+import json
+import zlib
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import builder_fs
+
+try:
+    from PIL import Image, features
+    HAS_PIL = True
+except ImportError:
+    # Without Pillow images only get lossless PNG recompression
+    HAS_PIL = False
+
+# Bump when a minifier changes, so cached results are not reused
+MINIFY_VERSION = 1
+# Larger files are left alone, they are usually generated bundles
+MINIFY_MAX_SIZE = 8 * 1024 * 1024
+# Below this many files a process pool costs more than it saves
+MIN_FILES_FOR_POOL = 32
+# Bump when the image pipeline changes
+IMAGE_VERSION = 1
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Metadata chunks that do not affect how the image looks
+PNG_DROP_CHUNKS = (b"tEXt", b"zTXt", b"iTXt", b"tIME")
+
+IDENT_RE = re.compile(r'[A-Za-z0-9_$\\\u0080-\uffff]')
+REGEX_KEYWORDS = ("return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+                  "throw", "case", "do", "else", "yield", "await")
+
+
+class MinifyError(Exception):
+    pass
+
+
+def _is_ident(ch):
+    return ch is not None and IDENT_RE.match(ch) is not None
+
+
+def _needs_space(prev, nxt):
+    # Whether dropping the whitespace between prev and nxt would change the
+    # meaning of the code
+    if prev is None:
+        return False
+    if _is_ident(prev) and _is_ident(nxt):
+        return True
+    if prev == nxt and prev in "+-":
+        return True
+    if "/" in (prev, nxt) or "." in (prev, nxt):
+        return True
+    return (prev, nxt) in (("<", "!"), ("-", ">"))
+
+
+def minify_js_lines(text):
+    """Conservative JavaScript minifier.
+
+    Removes comments (except /*! and @license ones), indentation and
+    blank lines, and whitespace that does not separate tokens. Line breaks
+    between statements are kept, so automatic semicolon insertion behaves
+    exactly as before. Returns (output_lines, line_map) where line_map[i]
+    is the 0-based input line output line i came from. Raises MinifyError
+    on input it does not understand.
+    """
+    lines = []
+    line_map = []
+    buf = []
+    buf_line = [0]
+    state = {"space": False, "newline": False}
+    last = {"char": None, "word": None}
+
+    n = len(text)
+    i = 0
+    line_no = 0
+    # Brace depth at which each open template literal's ${ } was entered
+    template_stack = []
+    brace_depth = 0
+
+    def flush():
+        if buf:
+            lines.append("".join(buf))
+            line_map.append(buf_line[0])
+            buf.clear()
+
+    def emit(token, first, last_char, word=None):
+        if state["newline"] and buf:
+            flush()
+        elif state["space"] and _needs_space(last["char"], first):
+            buf.append(" ")
+        if not buf:
+            buf_line[0] = line_no
+        state["space"] = state["newline"] = False
+        buf.append(token)
+        last["char"] = last_char
+        last["word"] = word
+
+    def emit_raw_lines(token, start_line):
+        # Token containing line breaks (template literal, kept comment)
+        nonlocal line_no
+        parts = token.split("\n")
+        emit(parts[0], token[0], token[-1])
+        for offset, part in enumerate(parts[1:], 1):
+            flush()
+            buf_line[0] = start_line + offset
+            buf.append(part)
+        line_no = start_line + len(parts) - 1
+
+    def regex_allowed():
+        ch = last["char"]
+        if ch is None:
+            return True
+        if last["word"] is not None:
+            return last["word"] in REGEX_KEYWORDS
+        if _is_ident(ch):
+            return False
+        return ch not in ")]}\"'`"
+
+    def scan_string(start, quote):
+        j = start + 1
+        while j < n:
+            c = text[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == quote:
+                return j + 1
+            if c == "\n":
+                raise MinifyError("Unterminated string")
+            j += 1
+        raise MinifyError("Unterminated string")
+
+    def scan_template_chunk(start):
+        # From just after ` or } up to and including the closing ` or ${
+        j = start
+        while j < n:
+            c = text[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "`":
+                return j + 1, True
+            if c == "$" and j + 1 < n and text[j + 1] == "{":
+                return j + 2, False
+            j += 1
+        raise MinifyError("Unterminated template literal")
+
+    def scan_regex(start):
+        j = start + 1
+        in_class = False
+        while j < n:
+            c = text[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "\n":
+                raise MinifyError("Unterminated regular expression")
+            if in_class:
+                if c == "]":
+                    in_class = False
+            elif c == "[":
+                in_class = True
+            elif c == "/":
+                j += 1
+                while j < n and _is_ident(text[j]):
+                    j += 1
+                return j
+            j += 1
+        raise MinifyError("Unterminated regular expression")
+
+    while i < n:
+        c = text[i]
+
+        if c == "\n":
+            state["newline"] = True
+            line_no += 1
+            i += 1
+            continue
+        if c in " \t\r\f\v\u00a0\ufeff":
+            state["space"] = True
+            i += 1
+            continue
+
+        if c == "/" and i + 1 < n and text[i + 1] == "/":
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+            continue
+
+        if c == "/" and i + 1 < n and text[i + 1] == "*":
+            end = text.find("*/", i + 2)
+            if end == -1:
+                raise MinifyError("Unterminated comment")
+            comment = text[i:end + 2]
+            if comment.startswith("/*!") or "@license" in comment or "@preserve" in comment:
+                # Kept comments are transparent for the tokens around them
+                before = dict(last)
+                emit_raw_lines(comment, line_no)
+                last.update(before)
+                state["space"] = True
+            else:
+                newlines = comment.count("\n")
+                if newlines:
+                    state["newline"] = True
+                    line_no += newlines
+                else:
+                    state["space"] = True
+            i = end + 2
+            continue
+
+        if c in "'\"":
+            end = scan_string(i, c)
+            if "\n" in text[i:end]:
+                # Line continuation inside the string
+                emit_raw_lines(text[i:end], line_no)
+            else:
+                emit(text[i:end], c, c)
+            i = end
+            continue
+
+        if c == "`" or (c == "}" and template_stack and template_stack[-1] == brace_depth):
+            if c == "}":
+                template_stack.pop()
+            end, closed = scan_template_chunk(i + 1)
+            chunk = text[i:end]
+            if "\n" in chunk:
+                emit_raw_lines(chunk, line_no)
+            else:
+                emit(chunk, c, chunk[-1])
+            if closed:
+                last["char"] = "`"
+            else:
+                template_stack.append(brace_depth)
+                last["char"] = "{"
+            last["word"] = None
+            i = end
+            continue
+
+        if c == "/" and regex_allowed():
+            end = scan_regex(i)
+            emit(text[i:end], "/", "/")
+            i = end
+            continue
+
+        if _is_ident(c):
+            j = i + 1
+            while j < n and _is_ident(text[j]):
+                j += 1
+            # Numbers with exponents (1e-5) and decimals stay one token
+            word = text[i:j]
+            if c.isdigit():
+                while j < n and (text[j] == "." or (text[j] in "+-" and text[j - 1] in "eE") or _is_ident(text[j])):
+                    j += 1
+                word = text[i:j]
+                emit(word, c, word[-1])
+            else:
+                emit(word, c, word[-1], word)
+            i = j
+            continue
+
+        if c == "{":
+            brace_depth += 1
+        elif c == "}":
+            brace_depth -= 1
+        emit(c, c, c)
+        i += 1
+
+    if template_stack:
+        raise MinifyError("Unterminated template literal")
+    flush()
+    return lines, line_map
+
+
+def minify_js(text):
+    try:
+        lines, _ = minify_js_lines(text)
+    except MinifyError:
+        return text
+    return "\n".join(lines) + "\n"
+
+
+CSS_TOKEN_RE = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/|url\([^)]*\))''', re.S)
+
+
+def minify_css(text):
+    # Strings, url(...) and /*! comments are kept verbatim, everything
+    # between them has its whitespace reduced
+    out = []
+    for index, part in enumerate(CSS_TOKEN_RE.split(text)):
+        if index % 2:
+            if part.startswith("/*"):
+                if part.startswith("/*!"):
+                    out.append(part)
+                continue
+            out.append(part)
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+        part = re.sub(r': ', ':', part)
+        part = part.replace(";}", "}")
+        out.append(part)
+    return "".join(out).strip() + "\n"
+
+
+HTML_RAW_RE = re.compile(r'(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if|<!|>).*?-->', re.S)
+HTML_TAG_RE = re.compile(r'(<[^>]*>)')
+JS_TYPE_RE = re.compile(r'\btype\s*=\s*["\']?(?!text/javascript|application/javascript|module)[^"\'\s>]+', re.I)
+
+
+def _collapse_html(text):
+    text = HTML_COMMENT_RE.sub("", text)
+    # Only text between tags is touched, attribute values stay as they are.
+    # Whitespace between inline elements is significant, keep one character.
+    parts = HTML_TAG_RE.split(text)
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r'\s+', lambda m: "\n" if "\n" in m.group(0) else " ", parts[index])
+    return "".join(parts)
+
+
+def minify_html(text):
+    out = []
+    pos = 0
+    for match in HTML_RAW_RE.finditer(text):
+        out.append(_collapse_html(text[pos:match.start()]))
+        open_tag, tag, body, close_tag = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+        if tag == "script" and not JS_TYPE_RE.search(open_tag) and "src=" not in open_tag.lower():
+            body = minify_js(body).strip()
+        elif tag == "style":
+            body = minify_css(body).strip()
+        out.append(open_tag + body + close_tag)
+        pos = match.end()
+    out.append(_collapse_html(text[pos:]))
+    return "".join(out).strip() + "\n"
+
+
+MINIFIERS = {
+    ".js": minify_js,
+    ".css": minify_css,
+    ".html": minify_html,
+    ".htm": minify_html,
+}
+
+
+def is_minifiable(path):
+    name = os.path.basename(path).lower()
+    if ".min." in name:
+        return False
+    return os.path.splitext(name)[1] in MINIFIERS
+
+
+def minify_file(path, cache_dir):
+    # Worker: minifies path in place (through a cache keyed on the content)
+    # and returns (ext, size_before, size_after, from_cache)
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) > MINIFY_MAX_SIZE:
+        return ext, len(data), len(data), False
+
+    key = hashlib.sha256(f"minify{MINIFY_VERSION}{ext}\0".encode() + data).hexdigest()
+    cache_path = os.path.join(cache_dir, "minify", key[:2], key + ext)
+    from_cache = os.path.exists(cache_path)
+    if from_cache:
+        with open(cache_path, 'rb') as f:
+            result = f.read()
+    else:
+        try:
+            result = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+        except UnicodeDecodeError:
+            result = data
+        if len(result) >= len(data):
+            result = data
+        write_atomic(cache_path, result)
+
+    if result != data:
+        # Replace rather than rewrite, path may be a link into the source site
+        write_atomic(path, result)
+    return ext, len(data), len(result), from_cache
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def minify_tree(root, rel_paths, cache_dir, workers=None):
+    """Minify the given files under root across a process pool.
+
+    Returns ({rel_path: size_after}, {ext: {"files", "before", "after", "cached"}}).
+    """
+    paths = [rel for rel in rel_paths if is_minifiable(rel)]
+    results = _pool_map(minify_file, [os.path.join(root, rel) for rel in paths], (cache_dir,), workers)
+
+    sizes = {}
+    report = {}
+    for rel, (ext, before, after, cached) in zip(paths, results):
+        sizes[rel] = after
+        entry = report.setdefault(ext, {"files": 0, "before": 0, "after": 0, "cached": 0})
+        entry["files"] += 1
+        entry["before"] += before
+        entry["after"] += after
+        entry["cached"] += int(cached)
+    return sizes, report
+
+
+def _pool_map(func, paths, extra_args, workers=None, min_files=MIN_FILES_FOR_POOL):
+    # func(path, *extra_args) for every path, in a process pool when worth it
+    if len(paths) < min_files or workers == 1:
+        return [func(path, *extra_args) for path in paths]
+    columns = [[arg] * len(paths) for arg in extra_args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, paths, *columns, chunksize=16))
+
+
+def site_files(root):
+    return list(builder_fs.scan_tree(root))
+
+
+def recompress_png(data):
+    # Lossless: the image data is inflated and deflated again at the highest
+    # level, and metadata chunks are dropped. Pixels are untouched.
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+    chunks = []
+    idat = []
+    pos = len(PNG_SIGNATURE)
+    try:
+        while pos < len(data):
+            length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            pos += 12 + length
+            if kind == b"acTL":
+                # Animated PNG, frames live in other chunks too
+                return data
+            if kind == b"IDAT":
+                if not idat:
+                    chunks.append((b"IDAT", None))
+                idat.append(body)
+            elif kind not in PNG_DROP_CHUNKS:
+                chunks.append((kind, body))
+            if kind == b"IEND":
+                break
+        raw = zlib.decompress(b"".join(idat))
+    except (struct.error, zlib.error):
+        return data
+
+    best = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        packed = compressor.compress(raw) + compressor.flush()
+        if best is None or len(packed) < len(best):
+            best = packed
+
+    out = [PNG_SIGNATURE]
+    for kind, body in chunks:
+        if body is None:
+            kind, body = b"IDAT", best
+        out.append(struct.pack(">I", len(body)) + kind + body
+                   + struct.pack(">I", zlib.crc32(kind + body) & 0xffffffff))
+    result = b"".join(out)
+    return result if len(result) < len(data) else data
+
+
+def can_transcode():
+    # Resizing and WebP need Pillow (with WebP support for the latter)
+    return HAS_PIL, HAS_PIL and features.check("webp")
+
+
+def _pil_encode(data, ext, max_size, webp, quality):
+    # Returns (bytes, ext) of the resized and/or transcoded image, or None
+    import io
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, "is_animated", False):
+            return None
+        resized = bool(max_size) and max(image.size) > max_size
+        if not resized and not webp:
+            return None
+        image.load()
+        if resized:
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+        out = io.BytesIO()
+        if webp:
+            # PNGs stay lossless, JPEGs were lossy to begin with
+            image.save(out, "WEBP", lossless=(ext == ".png"), quality=quality, method=6)
+            return out.getvalue(), ".webp"
+        if ext == ".png":
+            image.save(out, "PNG", optimize=True)
+        else:
+            image.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue(), ext
+
+
+def optimize_image(path, cache_dir, settings):
+    # Worker: recompresses (and with Pillow resizes / transcodes) the image
+    # at path in place, through a cache keyed on content and settings.
+    # Returns (ext, size_before, size_after, new_path or None, from_cache).
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    key = hashlib.sha256(f"image{IMAGE_VERSION}{ext}{json.dumps(settings, sort_keys=True)}\0".encode()
+                         + data).hexdigest()
+    cache_base = os.path.join(cache_dir, "images", key[:2], key)
+    from_cache = False
+    for out_ext in (".webp", ext):
+        if os.path.exists(cache_base + out_ext):
+            with open(cache_base + out_ext, 'rb') as f:
+                result = f.read()
+            from_cache = True
+            break
+    else:
+        result, out_ext = data, ext
+        encoded = None
+        if HAS_PIL and (settings.get("max_size") or settings.get("webp")):
+            try:
+                encoded = _pil_encode(data, ext, settings.get("max_size"), settings.get("webp"),
+                                      settings.get("quality", 80))
+            except Exception:
+                encoded = None
+        if encoded is not None:
+            result, out_ext = encoded
+            if out_ext == ".webp" and len(result) >= len(data) and not settings.get("max_size"):
+                # Transcoding did not pay off
+                result, out_ext = data, ext
+        if out_ext == ".png":
+            result = recompress_png(result)
+        if len(result) > len(data) and out_ext == ext and encoded is None:
+            result = data
+        write_atomic(cache_base + out_ext, result)
+
+    new_path = None
+    if out_ext != ext:
+        new_path = os.path.splitext(path)[0] + out_ext
+        write_atomic(new_path, result)
+        os.remove(path)
+    elif result != data:
+        write_atomic(path, result)
+    return ext, len(data), len(result), new_path, from_cache
+
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def optimize_images(root, rel_paths, cache_dir, settings, workers=None):
+    """Optimize the given images under root across a process pool.
+
+    settings: {"max_size": longest side in pixels or None, "webp": bool,
+    "quality": 1-100}. Returns ({rel_path: (new_rel_path, size_after)},
+    {ext: {"files", "before", "after", "cached"}}).
+    """
+    paths = [rel for rel in rel_paths if is_image(rel)]
+    # Images keep their format where the .webp name is taken, by a file
+    # already there or by another image (logo.png and logo.jpg)
+    keep = set()
+    if settings.get("webp"):
+        targets = {}
+        for rel in paths:
+            targets.setdefault((os.path.splitext(rel)[0] + ".webp").lower(), []).append(rel)
+        for target, claimants in targets.items():
+            if len(claimants) > 1 or os.path.exists(os.path.join(root, os.path.splitext(claimants[0])[0] + ".webp")):
+                keep.update(claimants)
+    results = {}
+    for group, group_settings in (([rel for rel in paths if rel not in keep], settings),
+                                  ([rel for rel in paths if rel in keep], dict(settings, webp=False))):
+        if group:
+            results.update(zip(group, _pool_map(optimize_image, [os.path.join(root, rel) for rel in group],
+                                                (cache_dir, group_settings), workers, min_files=4)))
+
+    outputs = {}
+    report = {}
+    for rel in paths:
+        ext, before, after, new_path, cached = results[rel]
+        new_rel = os.path.relpath(new_path, root).replace(os.sep, "/") if new_path else rel
+        outputs[rel] = (new_rel, after)
+        entry = report.setdefault(ext, {"files": 0, "before": 0, "after": 0, "cached": 0})
+        entry["files"] += 1
+        entry["before"] += before
+        entry["after"] += after
+        entry["cached"] += int(cached)
+    return outputs, report
+
+
+def rewrite_references(root, renames):
+    """Point references in HTML and CSS files at renamed images.
+
+    renames maps old to new relative paths. References are matched by file
+    name, so a name is left alone while some file under root still has it.
+    Returns {rel_path: new_size} of the rewritten files.
+    """
+    files = builder_fs.scan_tree(root)
+    present = {os.path.basename(rel) for rel in files}
+    names = {os.path.basename(old): os.path.basename(new) for old, new in renames.items()
+             if os.path.basename(old) not in present}
+    if not names:
+        return {}
+
+    pattern = re.compile(r'(?<![\w.-])(' + "|".join(re.escape(name) for name in names) + r')(?=["\'\s)?#]|$)')
+    sizes = {}
+    for rel in files:
+        if os.path.splitext(rel)[1].lower() not in (".html", ".htm", ".css"):
+            continue
+        path = os.path.join(root, rel)
+        with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            text = f.read()
+        new_text = pattern.sub(lambda m: names[m.group(1)], text)
+        if new_text != text:
+            data = new_text.encode('utf-8', errors='surrogateescape')
+            write_atomic(path, data)
+            sizes[rel] = len(data)
+    return sizes
@@ -0,0 +1,149 @@
+import os
+import re
+import hashlib
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import builder_fs
+import builder_bundle
+
+# Bump when the extracted references change, so cached scans are not reused
+PREFLIGHT_VERSION = 1
+# Files above this size are reported, they bloat the app and slow installs
+LARGE_FILE = 50 * 1024 * 1024
+# Files whose references are checked
+REFERENCE_EXTENSIONS = (".html", ".htm", ".css")
+HTML_REF_RE = re.compile(r'\b(?:src|href|poster)\s*=\s*["\']([^"\']*)["\']', re.I)
+CSS_REF_RE = re.compile(r'url\(\s*["\']?([^"\')]*)["\']?\s*\)|@import\s+["\']([^"\']+)["\']', re.I)
+# References that are not files: anchors, inline data, other schemes
+IGNORED_REF_RE = re.compile(r'^(#|data:|javascript:|mailto:|tel:|sms:|about:|blob:|https:)|\{\{|\$\{', re.I)
+
+
+def _scan_dir(abs_dir, rel_dir):
+    # ({rel: (size, mtime_ns)}, [sub directory rel paths]) of one directory
+    files = {}
+    subdirs = []
+    with os.scandir(abs_dir) as it:
+        for entry in it:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=True):
+                subdirs.append(rel)
+            else:
+                st = entry.stat(follow_symlinks=True)
+                files[rel] = (st.st_size, st.st_mtime_ns)
+    return files, subdirs
+
+
+def walk(root, workers=8):
+    # Like builder_fs.scan_tree, with directories listed in parallel
+    files = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_files, subdirs = future.result()
+                files.update(dir_files)
+                pending.update(pool.submit(_scan_dir, os.path.join(root, rel), rel) for rel in subdirs)
+    return files
+
+
+def extract_references(path):
+    # Every src/href/url() in an HTML or CSS file, in order
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    if path.lower().endswith(".css"):
+        return [a or b for a, b in CSS_REF_RE.findall(text)]
+    refs = HTML_REF_RE.findall(text)
+    # Inline styles and <style> blocks
+    refs += [a or b for a, b in CSS_REF_RE.findall(text)]
+    return refs
+
+
+def check_reference(rel, ref, files):
+    # (kind, message) for a reference that will not work in the app, else None
+    ref = ref.strip()
+    if not ref or IGNORED_REF_RE.search(ref):
+        return None
+    if ref.lower().startswith("http://"):
+        return "insecure", f"{rel}: {ref} is loaded over http://, which Android blocks by default"
+    if ref.startswith("//"):
+        return "absolute", f"{rel}: {ref} has no scheme and resolves to file:// in the app"
+    if ref.startswith("/"):
+        return "absolute", f"{rel}: {ref} is relative to the server root and breaks under file://"
+    if re.match(r'^[a-z][a-z0-9+.-]*:', ref, re.I):
+        return None
+    target = unquote(re.split(r'[?#]', ref, 1)[0])
+    if not target:
+        return None
+    target = os.path.normpath(os.path.join(os.path.dirname(rel), target)).replace(os.sep, "/")
+    if target == ".." or target.startswith("../"):
+        return "outside", f"{rel}: {ref} points outside the site folder"
+    directory_index = "index.html" if target == "." else target + "/index.html"
+    if target not in files and directory_index not in files and os.path.basename(target) not in builder_bundle.PLATFORM_SCRIPTS:
+        return "missing", f"{rel}: {ref} does not exist"
+    return None
+
+
+def scan_site(site_dir, cache_dir=None, workers=8):
+    """Check a website folder before it is wrapped.
+
+    Returns a dict with the asset "index" ({rel: size}), "total_size",
+    the number of "references" checked and how many files were read
+    "from_cache", plus the "errors" that block a wrap and the "warnings"
+    (kind, message) that do not. References are cached per file by size
+    and modification time, so a rescan only reads changed files.
+    """
+    report = {"index": {}, "total_size": 0, "references": 0, "from_cache": 0, "errors": [], "warnings": []}
+    try:
+        files = walk(site_dir, workers)
+    except OSError as e:
+        report["errors"].append(f"Could not read the website folder: {e}")
+        return report
+
+    report["index"] = {rel: size for rel, (size, _) in sorted(files.items())}
+    report["total_size"] = sum(report["index"].values())
+    if "index.html" not in files:
+        report["errors"].append("The website folder has no index.html at its top level")
+    for rel, (size, _) in sorted(files.items()):
+        if size > LARGE_FILE:
+            report["warnings"].append(("large", f"{rel} is {size // (1024 * 1024)} MB"))
+
+    cache_path = None
+    cached = {}
+    if cache_dir:
+        key = hashlib.sha256(os.path.abspath(site_dir).encode()).hexdigest()[:16]
+        cache_path = os.path.join(cache_dir, "preflight", key + ".json")
+        data = builder_fs.read_json(cache_path, {})
+        if isinstance(data, dict) and data.get("version") == PREFLIGHT_VERSION:
+            cached = data.get("files", {})
+
+    sources = [rel for rel in sorted(files) if rel.lower().endswith(REFERENCE_EXTENSIONS)]
+    refs = {}
+    stale = []
+    for rel in sources:
+        entry = cached.get(rel)
+        if entry and entry[:2] == list(files[rel]):
+            refs[rel] = entry[2]
+            report["from_cache"] += 1
+        else:
+            stale.append(rel)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rel, found in zip(stale, pool.map(lambda rel: extract_references(os.path.join(site_dir, rel)), stale)):
+            refs[rel] = found
+
+    for rel in sources:
+        for ref in refs[rel]:
+            report["references"] += 1
+            problem = check_reference(rel, ref, files)
+            if problem:
+                report["warnings"].append(problem)
+
+    if cache_path and stale:
+        try:
+            builder_fs.write_json(cache_path, {
+                "version": PREFLIGHT_VERSION,
+                "files": {rel: [files[rel][0], files[rel][1], refs[rel]] for rel in sources},
+            })
+        except OSError:
+            pass
+    return report
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import threading
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    # Windows: no CPU accounting for child processes
+    HAS_RESOURCE = False
+
+
+def children_cpu_time():
+    if not HAS_RESOURCE:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    def __init__(self, profile, name, category, parent=None, **args):
+        self.profile = profile
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.args = dict(args)
+        self.thread = threading.get_ident()
+        self.start = None
+        self.end = None
+        self.cpu = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def wall(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+    def add(self, **counters):
+        # Thread-safe, copy workers add to the span of the stage they serve
+        with self._lock:
+            for key, value in counters.items():
+                self.args[key] = self.args.get(key, 0) + value
+
+    def to_dict(self):
+        data = {
+            "name": self.name,
+            "category": self.category,
+            "start": round(self.start - self.profile.started, 6) if self.start is not None else None,
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+        }
+        if self.parent is not None:
+            data["parent"] = self.parent.name
+        data.update(self.args)
+        return data
+
+
+class BuildProfile:
+    """Wall time, CPU time, copy volume and subprocess time of one wrap.
+
+    Stages and commands are recorded as nested spans. The result can be
+    exported as JSON or as a Chrome trace-event file (chrome://tracing,
+    Perfetto).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def current(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def span(self, name, category="stage", **args):
+        return _SpanContext(self, name, category, args)
+
+    def counter(self):
+        # Returns on_copied(files, bytes, cpu) adding to the span active on
+        # this thread, for handing to copy workers running on other threads
+        span = self.current()
+        if span is None:
+            return None
+        return lambda files, size, cpu: span.add(files=files, bytes=size, worker_cpu=round(cpu, 6))
+
+    def record_command(self, cmd, start, end, child_cpu, returncode):
+        # Commands run in their own process, so they are measured by the
+        # caller and attached to the enclosing span afterwards
+        parent = self.current()
+        span = Span(self, cmd, "command", parent, returncode=returncode)
+        span.start, span.end, span.cpu = start, end, child_cpu
+        span.thread = threading.get_ident()
+        with self._lock:
+            self.spans.append(span)
+        if parent is not None:
+            parent.add(subprocess_time=round(end - start, 6), subprocess_cpu=round(child_cpu, 6))
+
+    def total(self):
+        ends = [span.end for span in self.spans if span.end is not None]
+        return (max(ends) - self.started) if ends else 0.0
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "total": round(self.total(), 6),
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+    def summary_lines(self):
+        lines = []
+        width = max([12] + [len(span.name) for span in self.spans if span.category == "stage"])
+        for span in self.spans:
+            if span.category != "stage":
+                continue
+            cpu = span.cpu + span.args.get("worker_cpu", 0)
+            line = f"{span.name:<{width}} {span.wall:8.2f}s wall {cpu:7.2f}s cpu"
+            if span.args.get("files"):
+                line += f"  {span.args['files']} files, {format_bytes(span.args.get('bytes', 0))}"
+            if span.args.get("bytes_saved"):
+                line += f"  {format_bytes(span.args['bytes_saved'])} saved"
+            if span.args.get("subprocess_time"):
+                line += f"  {span.args['subprocess_time']:.2f}s in commands"
+            lines.append(line)
+        lines.append(f"{'total':<{width}} {self.total():8.2f}s")
+        return lines
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def export_trace(self, path):
+        # Trace Event Format, complete ("X") events in microseconds
+        threads = {}
+        events = []
+        for span in self.spans:
+            if span.start is None or span.end is None:
+                continue
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            args = dict(span.args, cpu=round(span.cpu, 6))
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self.started) * 1e6),
+                "dur": round(span.wall * 1e6),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class _SpanContext:
+    def __init__(self, profile, name, category, args):
+        self.profile = profile
+        self.span = Span(profile, name, category, profile.current(), **args)
+
+    def __enter__(self):
+        local = self.profile._local
+        if not hasattr(local, "stack"):
+            local.stack = []
+        local.stack.append(self.span)
+        with self.profile._lock:
+            self.profile.spans.append(self.span)
+        self._cpu_start = time.thread_time()
+        self.span.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        self.span.cpu = time.thread_time() - self._cpu_start
+        self.profile._local.stack.pop()
+        return False
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024.0
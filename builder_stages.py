@@ -0,0 +1,156 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Stage:
+    """One unit of work in a wrap.
+
+    `requires` and `provides` name the resources (files, folders, facts)
+    the stage reads and produces. A stage starts as soon as everything it
+    requires has been provided. `func` returns True on success.
+    """
+
+    def __init__(self, name, func, requires=(), provides=(), label=None, weight=1):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.provides = tuple(provides) or (name,)
+        self.label = label or name
+        self.weight = weight
+
+        # Filled in by StageGraph.run
+        self.status = "pending"
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class StageGraph:
+    def __init__(self, stages, progress=None, should_stop=None, profile=None):
+        # progress(percent, message) receives overall progress, weighted per stage.
+        # With a BuildProfile every stage is recorded as a span.
+        self.stages = list(stages)
+        self.profile = profile
+        self.progress = progress
+        self.should_stop = should_stop or (lambda: False)
+        self._fractions = {stage.name: 0.0 for stage in self.stages}
+        self._lock = threading.Lock()
+
+        self.providers = {}
+        for stage in self.stages:
+            for resource in stage.provides:
+                if resource in self.providers:
+                    raise ValueError(f"Resource '{resource}' is provided by both "
+                                     f"'{self.providers[resource].name}' and '{stage.name}'")
+                self.providers[resource] = stage
+        for stage in self.stages:
+            for resource in stage.requires:
+                if resource not in self.providers:
+                    raise ValueError(f"Stage '{stage.name}' requires '{resource}' which no stage provides")
+        self._check_cycles()
+
+    def dependencies(self, stage):
+        return {self.providers[resource] for resource in stage.requires}
+
+    def _check_cycles(self):
+        state = {}
+
+        def visit(stage):
+            if state.get(stage.name) == "done":
+                return
+            if state.get(stage.name) == "visiting":
+                raise ValueError(f"Stage '{stage.name}' depends on itself")
+            state[stage.name] = "visiting"
+            for dep in self.dependencies(stage):
+                visit(dep)
+            state[stage.name] = "done"
+
+        for stage in self.stages:
+            visit(stage)
+
+    def report(self, stage, fraction, message=None):
+        # Called by stages (from any thread) to move the progress bar
+        with self._lock:
+            self._fractions[stage.name] = max(0.0, min(1.0, fraction))
+            total = sum(s.weight for s in self.stages) or 1
+            done = sum(s.weight * self._fractions[s.name] for s in self.stages)
+        if self.progress:
+            self.progress(int(100 * done / total), message or stage.label)
+
+    def run(self, workers=4):
+        # Returns True when every stage succeeded. On failure or stop no new
+        # stages are started, the running ones are waited for.
+        self.started = time.perf_counter()
+        available = set()
+        pending = list(self.stages)
+        running = {}
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                if not failed and not self.should_stop():
+                    for stage in [s for s in pending if all(r in available for r in s.requires)]:
+                        pending.remove(stage)
+                        stage.status = "running"
+                        self.report(stage, 0.0)
+                        running[pool.submit(self._run_stage, stage)] = stage
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    if future.result():
+                        stage.status = "done"
+                        available.update(stage.provides)
+                        self.report(stage, 1.0)
+                    else:
+                        stage.status = "failed"
+                        failed = True
+
+        for stage in pending:
+            stage.status = "skipped"
+        return not failed and not pending
+
+    def _run_stage(self, stage):
+        stage.start = time.perf_counter()
+        try:
+            if self.profile is None:
+                return bool(stage.func())
+            with self.profile.span(stage.name, "stage"):
+                return bool(stage.func())
+        except Exception as e:
+            stage.error = e
+            return False
+        finally:
+            stage.end = time.perf_counter()
+
+    def critical_path(self):
+        # Longest chain of finished stages by duration, in execution order
+        best = {}
+
+        def longest(stage):
+            if stage.name not in best:
+                chain = max((longest(dep) for dep in self.dependencies(stage)),
+                            key=lambda c: sum(s.duration for s in c), default=[])
+                best[stage.name] = chain + [stage]
+            return best[stage.name]
+
+        return max((longest(stage) for stage in self.stages if stage.end is not None),
+                   key=lambda c: sum(s.duration for s in c), default=[])
+
+    def timings(self):
+        # Per-stage timings relative to the start of the run
+        return [{
+            "stage": stage.name,
+            "status": stage.status,
+            "start": round(stage.start - self.started, 3) if stage.start is not None else None,
+            "duration": round(stage.duration, 3),
+        } for stage in self.stages]
@@ -0,0 +1,178 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import builder_fs
+
+# What a template consists of, relative to its folder. Everything else in the
+# folder (the builder's own scripts, test output, .git, ...) is not part of it.
+TEMPLATE_CONTENTS = ("config.xml", "package.json", "package-lock.json", "www", "res")
+REQUIRED_FILES = ("config.xml", "package.json")
+SNAPSHOT_INFO = ".snapshot.json"
+# Unreferenced snapshots kept around (for rolling back to a previous version)
+SNAPSHOT_KEEP = 3
+NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _ignore_system_files(directory, names):
+    return [name for name in names if name in (".DS_Store", "Thumbs.db", "__pycache__")]
+
+
+def scan_template(source_dir):
+    # {rel path: stat} of the files making up the template in source_dir
+    missing = [name for name in REQUIRED_FILES if not os.path.isfile(os.path.join(source_dir, name))]
+    if missing:
+        raise TemplateError(f"{source_dir} is not a template, missing: {', '.join(missing)}")
+    files = {}
+    for name in TEMPLATE_CONTENTS:
+        path = os.path.join(source_dir, name)
+        if os.path.isdir(path):
+            for rel, st in builder_fs.scan_tree(path, _ignore_system_files).items():
+                files[f"{name}/{rel}"] = st
+        elif os.path.isfile(path):
+            files[name] = os.stat(path)
+    return files
+
+
+class TemplateRegistry:
+    """Named, versioned snapshots of project templates.
+
+    A snapshot is an immutable copy of a template folder's config.xml,
+    package.json, www/ and res/, stored under its content hash in
+    <cache>/templates/snapshots/<hash>. Names point at snapshots through
+    <cache>/templates/<name>.json. Projects are cloned from snapshots, so
+    the source folder is only read again when it changed.
+    """
+
+    def __init__(self, cache_dir=None, engine=None):
+        self.root = os.path.join(cache_dir or builder_fs.default_cache_dir(), "templates")
+        self.engine = engine or builder_fs.CopyEngine()
+        # Snapshots never change, so their file lists are kept once read
+        self._files = {}
+
+    def snapshot_dir(self, digest):
+        return os.path.join(self.root, "snapshots", digest)
+
+    def _pointer_path(self, name):
+        if not NAME_RE.match(name):
+            raise TemplateError(f"Invalid template name '{name}'")
+        return os.path.join(self.root, name + ".json")
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(entry[:-5] for entry in os.listdir(self.root) if entry.endswith(".json"))
+
+    def info(self, name):
+        # {"name", "source", "hash", "signature", "files", "created"} or None
+        return builder_fs.read_json(self._pointer_path(name))
+
+    def get(self, name):
+        # Snapshot folder of a registered template, or None
+        info = self.info(name)
+        if not info or not os.path.isdir(self.snapshot_dir(info["hash"])):
+            return None
+        return self.snapshot_dir(info["hash"])
+
+    def add(self, name, source_dir):
+        """Register (or refresh) name from source_dir and return its snapshot folder.
+
+        The source is only hashed and copied when its files' sizes or
+        modification times differ from what the last snapshot saw.
+        """
+        source_dir = os.path.abspath(source_dir)
+        files = scan_template(source_dir)
+        signature = hashlib.sha256("".join(
+            f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\0" for rel, st in sorted(files.items())
+        ).encode()).hexdigest()
+
+        info = self.info(name)
+        if (info and info.get("source") == source_dir and info.get("signature") == signature
+                and os.path.isdir(self.snapshot_dir(info["hash"]))):
+            return self.snapshot_dir(info["hash"])
+
+        rel_paths = sorted(files)
+        digests = self.engine.map(lambda rel: builder_fs.hash_file(os.path.join(source_dir, rel)), rel_paths)
+        digest = hashlib.sha256("".join(
+            f"{rel}\0{file_hash}\0" for rel, file_hash in zip(rel_paths, digests)
+        ).encode()).hexdigest()[:32]
+
+        snapshot = self.snapshot_dir(digest)
+        if not os.path.isdir(snapshot):
+            self._build_snapshot(source_dir, files, digest)
+        builder_fs.write_json(self._pointer_path(name), {
+            "name": name,
+            "source": source_dir,
+            "hash": digest,
+            "signature": signature,
+            "files": len(rel_paths),
+            "created": time.time(),
+        }, indent=2)
+        self.prune()
+        return snapshot
+
+    def _build_snapshot(self, source_dir, files, digest):
+        # Real copies into a temporary folder renamed into place, so
+        # concurrent builds never see a partial snapshot
+        snapshots = os.path.join(self.root, "snapshots")
+        os.makedirs(snapshots, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=snapshots, prefix=".tmp-")
+        try:
+            jobs = [(os.path.join(source_dir, rel), os.path.join(tmp_dir, rel), st.st_size)
+                    for rel, st in files.items()]
+            self.engine.copy_files(jobs)
+            builder_fs.write_json(os.path.join(tmp_dir, SNAPSHOT_INFO), {
+                "hash": digest,
+                "files": {rel: st.st_size for rel, st in sorted(files.items())},
+            })
+            os.rename(tmp_dir, self.snapshot_dir(digest))
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Another build stored the same snapshot first
+            if not os.path.isdir(self.snapshot_dir(digest)):
+                raise
+
+    def files(self, snapshot):
+        # {rel path: size} of a snapshot, without walking it
+        if snapshot in self._files:
+            return self._files[snapshot]
+        info = builder_fs.read_json(os.path.join(snapshot, SNAPSHOT_INFO))
+        if info is None:
+            files = {rel: st.st_size for rel, st in builder_fs.scan_tree(snapshot).items()
+                     if rel != SNAPSHOT_INFO}
+        else:
+            files = info["files"]
+        self._files[snapshot] = files
+        return files
+
+    def remove(self, name):
+        try:
+            os.remove(self._pointer_path(name))
+        except FileNotFoundError:
+            return False
+        self.prune()
+        return True
+
+    def prune(self):
+        # Drop snapshots no name points at, keeping the most recent few
+        snapshots = os.path.join(self.root, "snapshots")
+        if not os.path.isdir(snapshots):
+            return
+        used = {info["hash"] for info in (self.info(name) for name in self.names()) if info}
+        unused = [os.path.join(snapshots, entry) for entry in os.listdir(snapshots)
+                  if entry not in used and not entry.startswith(".")]
+        unused.sort(key=os.path.getmtime, reverse=True)
+        for path in unused[SNAPSHOT_KEEP:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def source_name(source_dir):
+    # Registry name for an unnamed template folder
+    digest = hashlib.sha256(os.path.abspath(source_dir).encode()).hexdigest()[:12]
+    return f"dir-{digest}"
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import builder_fs
+
+# Events arriving within DEBOUNCE seconds of each other are synced together,
+# but never held back longer than MAX_DELAY
+DEBOUNCE = 0.15
+MAX_DELAY = 2.0
+POLL_INTERVAL = 0.5
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Changed paths under root, from Linux inotify through ctypes.
+
+    Every folder gets a watch of its own; folders created or moved in
+    later are added as they appear. Raises OSError when inotify is not
+    available or the watch limit is reached.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # {watch descriptor: folder relative to root}
+        self.watches = {}
+        try:
+            self.add_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, rel_dir):
+        dirs = []
+        path = os.path.join(self.root, rel_dir)
+        self._add_watch(rel_dir)
+        builder_fs.scan_tree(path, dirs=dirs)
+        for sub in dirs:
+            self._add_watch(f"{rel_dir}/{sub}" if rel_dir else sub)
+
+    def _add_watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # Gone again already
+                return
+            raise OSError(error, f"Could not watch {path}: {os.strerror(error)}")
+        # Re-adding a folder that was moved updates its path
+        self.watches[wd] = rel_dir
+
+    def changes(self, timeout):
+        # Set of changed relative paths, empty after timeout seconds without
+        # events. "" means everything (the kernel queue overflowed).
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 256 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changed.add("")
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            rel_dir = self.watches.get(wd)
+            if rel_dir is None or mask & IN_DELETE_SELF:
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir and name else (name or rel_dir)
+            changed.add(rel)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(rel)
+                except FileNotFoundError:
+                    pass
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Changed paths under root, by comparing sizes and mtimes every interval."""
+
+    def __init__(self, root, interval=POLL_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.state = self._scan()
+
+    def _scan(self):
+        dirs = []
+        files = {rel: (st.st_size, st.st_mtime_ns) for rel, st in builder_fs.scan_tree(self.root, dirs=dirs).items()}
+        files.update((rel, None) for rel in dirs)
+        return files
+
+    def changes(self, timeout):
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        state = self._scan()
+        changed = {rel for rel in state.keys() | self.state.keys() if state.get(rel, 0) != self.state.get(rel, 0)}
+        self.state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root, poll=False):
+    # inotify where it works, polling elsewhere (macOS, Windows, network
+    # filesystems, too many folders for the watch limit)
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root)
+
+
+def next_batch(watcher, should_stop, timeout=1.0):
+    """Wait for changes and return them once a burst of events is over.
+
+    Returns an empty set when should_stop() turned true. Only the topmost
+    of nested paths is kept, syncing a folder covers what is inside it.
+    """
+    changed = set()
+    while not changed:
+        if should_stop():
+            return set()
+        changed = watcher.changes(timeout)
+    first = time.monotonic()
+    while time.monotonic() - first < MAX_DELAY and not should_stop():
+        more = watcher.changes(DEBOUNCE)
+        if not more:
+            break
+        changed |= more
+    if "" in changed:
+        return {""}
+    return {rel for rel in changed if not _has_parent_in(rel, changed)}
+
+
+def _has_parent_in(rel, paths):
+    while "/" in rel:
+        rel = rel.rsplit("/", 1)[0]
+        if rel in paths:
+            return True
+    return False